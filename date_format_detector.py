@@ -1,6 +1,9 @@
 from datetime import datetime
-from typing import Optional, Literal, Set
+from functools import lru_cache
+from typing import Optional, Literal, Set, Dict, List, Iterator, Tuple
 import re
+import string
+import sys
 
 
 # Month names for text-based date parsing
@@ -11,50 +14,112 @@ MONTH_NAMES = {
     'sep': 9, 'sept': 9, 'oct': 10, 'nov': 11, 'dec': 12
 }
 
-# Common date format patterns (ordered by specificity)
+# Common date format patterns (ordered by specificity), compiled once at import
 FORMAT_PATTERNS = [
     # ISO formats with timezone and microseconds
-    (r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6}[+-]\d{2}:\d{2}$', '%Y-%m-%d %H:%M:%S.%f%z'),
-    (r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3,6}[+-]\d{2}:\d{2}$', '%Y-%m-%d %H:%M:%S.%f%z'),
-    (r'^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}\.\d{6}[+-]\d{2}:\d{2}$', '%Y.%m.%d %H:%M:%S.%f%z'),
-    (r'^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}\.\d{3,6}[+-]\d{2}:\d{2}$', '%Y.%m.%d %H:%M:%S.%f%z'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6}[+-]\d{2}:\d{2}$'), '%Y-%m-%d %H:%M:%S.%f%z'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3,6}[+-]\d{2}:\d{2}$'), '%Y-%m-%d %H:%M:%S.%f%z'),
+    (re.compile(r'^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}\.\d{6}[+-]\d{2}:\d{2}$'), '%Y.%m.%d %H:%M:%S.%f%z'),
+    (re.compile(r'^\d{4}\.\d{2}\.\d{2} \d{2}:\d{2}:\d{2}\.\d{3,6}[+-]\d{2}:\d{2}$'), '%Y.%m.%d %H:%M:%S.%f%z'),
     
     # ISO formats with timezone (no microseconds)
-    (r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}$', '%Y-%m-%d %H:%M:%S%z'),
-    (r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}$', '%Y-%m-%dT%H:%M:%S%z'),
-    (r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z$', '%Y-%m-%dT%H:%M:%S.%fZ'),
-    (r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$', '%Y-%m-%dT%H:%M:%SZ'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}$'), '%Y-%m-%d %H:%M:%S%z'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}$'), '%Y-%m-%dT%H:%M:%S%z'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z$'), '%Y-%m-%dT%H:%M:%S.%fZ'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z$'), '%Y-%m-%dT%H:%M:%SZ'),
     
     # ISO formats (no timezone)
-    (r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6}$', '%Y-%m-%d %H:%M:%S.%f'),
-    (r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$', '%Y-%m-%d %H:%M:%S'),
-    (r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$', '%Y-%m-%dT%H:%M:%S'),
-    (r'^\d{4}-\d{2}-\d{2}$', '%Y-%m-%d'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{6}$'), '%Y-%m-%d %H:%M:%S.%f'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'), '%Y-%m-%d %H:%M:%S'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}$'), '%Y-%m-%dT%H:%M:%S'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}$'), '%Y-%m-%d'),
     
     # Dotted formats
-    (r'^\d{4}\.\d{2}\.\d{2}$', '%Y.%m.%d'),
-    (r'^\d{2}\.\d{2}\.\d{4}$', None),  # Ambiguous, needs locale
+    (re.compile(r'^\d{4}\.\d{2}\.\d{2}$'), '%Y.%m.%d'),
+    (re.compile(r'^\d{2}\.\d{2}\.\d{4}$'), None),  # Ambiguous, needs locale
     
     # Slash formats
-    (r'^\d{2}/\d{2}/\d{4}$', None),  # Ambiguous, needs locale
-    (r'^\d{1,2}/\d{1,2}/\d{4}$', None),  # Ambiguous, needs locale
-    (r'^\d{4}/\d{2}/\d{2}$', '%Y/%m/%d'),
+    (re.compile(r'^\d{2}/\d{2}/\d{4}$'), None),  # Ambiguous, needs locale
+    (re.compile(r'^\d{1,2}/\d{1,2}/\d{4}$'), None),  # Ambiguous, needs locale
+    (re.compile(r'^\d{4}/\d{2}/\d{2}$'), '%Y/%m/%d'),
 ]
 
+# All FORMAT_PATTERNS as one anchored alternation; group i+1 is FORMAT_PATTERNS[i]
+_COMBINED_FORMAT_PATTERN = re.compile(
+    '^(?:' + '|'.join(f'({pattern.pattern[1:-1]})' for pattern, _ in FORMAT_PATTERNS) + ')$'
+)
+
+# Character-class signature of a date string: ASCII digits -> 'D', letters -> 'A'
+# (except the ISO 'T'/'Z' markers), separators and everything else unchanged
+_SIGNATURE_TABLE = str.maketrans({
+    **{c: 'D' for c in string.digits},
+    **{c: 'A' for c in string.ascii_letters if c not in 'TZ'},
+})
+
+
+def _expand_signatures(pattern: str) -> List[str]:
+    """Enumerate every character-class signature a FORMAT_PATTERNS regex can match."""
+    signatures = ['']
+    for token in re.findall(r'\\d\{\d+(?:,\d+)?\}|\[[^\]]+\]|\\.|.', pattern[1:-1]):
+        if token.startswith('\\d'):
+            low, _, high = token[3:-1].partition(',')
+            options = ['D' * n for n in range(int(low), int(high or low) + 1)]
+        elif token.startswith('['):
+            options = list(token[1:-1])
+        else:
+            options = [token[-1]]
+        signatures = [sig + option for sig in signatures for option in options]
+    return signatures
+
+
+def _build_signature_table() -> Dict[str, List[int]]:
+    """Map each signature to the FORMAT_PATTERNS entries matching it, in list order.
+    
+    Entries sharing a format with an earlier candidate are dropped: a format that
+    failed validation for a string fails again, so probing it twice only costs.
+    """
+    table: Dict[str, List[int]] = {}
+    for idx, (pattern, format_str) in enumerate(FORMAT_PATTERNS):
+        for signature in _expand_signatures(pattern.pattern):
+            candidates = table.setdefault(signature, [])
+            if all(FORMAT_PATTERNS[other][1] != format_str for other in candidates):
+                candidates.append(idx)
+    return table
+
+
+_SIGNATURE_TO_PATTERNS = _build_signature_table()
+
+# Text dates: "13 October 2024" and "October 13, 2024" / "July 8th 2022"
+_TEXT_DAY_MONTH_YEAR = re.compile(r'^(\d{1,2})\s+([A-Za-z]+)\s+(\d{4})$')
+_TEXT_MONTH_DAY_YEAR = re.compile(r'^([A-Za-z]+)\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})$')
+
+# Slash dates needing locale resolution
+_SLASH_PADDED = re.compile(r'^\d{2}/\d{2}/\d{4}$')
+_SLASH_UNPADDED = re.compile(r'^\d{1,2}/\d{1,2}/\d{4}$')
+
+
+def _matching_pattern_indices(date_string: str) -> Iterator[int]:
+    """Yield indices of FORMAT_PATTERNS entries matching date_string, in order."""
+    match = _COMBINED_FORMAT_PATTERN.match(date_string)
+    if not match:
+        return
+    
+    first_match = match.lastindex - 1
+    yield first_match
+    for idx in range(first_match + 1, len(FORMAT_PATTERNS)):
+        if FORMAT_PATTERNS[idx][0].match(date_string):
+            yield idx
+
 
 def _detect_text_date(date_string: str) -> Optional[str]:
     """Detect text-based date formats like '13 October 2024' or 'July 8th 2022'."""
-    # Pattern: "13 October 2024" or "October 13, 2024"
-    pattern1 = r'^(\d{1,2})\s+([A-Za-z]+)\s+(\d{4})$'
-    pattern2 = r'^([A-Za-z]+)\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})$'
-    
-    match = re.match(pattern1, date_string)
+    match = _TEXT_DAY_MONTH_YEAR.match(date_string)
     if match:
         month = match.group(2).lower()
         if month in MONTH_NAMES or len(month) > 3:
             return '%d %B %Y' if len(month) > 3 else '%d %b %Y'
     
-    match = re.match(pattern2, date_string)
+    match = _TEXT_MONTH_DAY_YEAR.match(date_string)
     if match:
         month = match.group(1).lower()
         if month in MONTH_NAMES or len(month) > 3:
@@ -68,14 +133,14 @@ def _resolve_ambiguous_format(date_string: str, locale: str) -> str:
     # For DD/MM/YYYY (UK/EU) vs MM/DD/YYYY (US)
     if '/' in date_string:
         if locale in ['UK', 'EU']:
-            if re.match(r'^\d{2}/\d{2}/\d{4}$', date_string):
+            if _SLASH_PADDED.match(date_string):
                 return '%d/%m/%Y'
-            elif re.match(r'^\d{1,2}/\d{1,2}/\d{4}$', date_string):
+            elif _SLASH_UNPADDED.match(date_string):
                 return '%d/%m/%Y'
         else:  # US
-            if re.match(r'^\d{2}/\d{2}/\d{4}$', date_string):
+            if _SLASH_PADDED.match(date_string):
                 return '%m/%d/%Y'
-            elif re.match(r'^\d{1,2}/\d{1,2}/\d{4}$', date_string):
+            elif _SLASH_UNPADDED.match(date_string):
                 return '%m/%d/%Y'
     
     # For DD.MM.YYYY (EU) vs MM.DD.YYYY (US)
@@ -88,13 +153,70 @@ def _resolve_ambiguous_format(date_string: str, locale: str) -> str:
     raise ValueError(f"Cannot resolve ambiguous format for '{date_string}'")
 
 
-def _validate_format(date_string: str, format_str: str) -> bool:
-    """Validate that a format string can parse the date string."""
+# ISO formats that datetime.fromisoformat parses to the same value as strptime,
+# limited to the strict shapes where the two agree ('Z' formats are left out:
+# strptime treats the 'Z' as a literal and returns a naive datetime)
+_ISO_TIME = r'(?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]'
+_ISO_OFFSET = r'[+-](?:[01][0-9]|2[0-3]):[0-5][0-9]'
+_ISO_FAST_PATH = {
+    '%Y-%m-%d': re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}'),
+    '%Y-%m-%d %H:%M:%S': re.compile(rf'[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}} {_ISO_TIME}'),
+    '%Y-%m-%dT%H:%M:%S': re.compile(rf'[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}T{_ISO_TIME}'),
+    '%Y-%m-%d %H:%M:%S.%f': re.compile(rf'[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}} {_ISO_TIME}\.[0-9]{{6}}'),
+    '%Y-%m-%d %H:%M:%S%z': re.compile(rf'[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}} {_ISO_TIME}{_ISO_OFFSET}'),
+    '%Y-%m-%dT%H:%M:%S%z': re.compile(rf'[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}T{_ISO_TIME}{_ISO_OFFSET}'),
+    '%Y-%m-%d %H:%M:%S.%f%z': re.compile(
+        rf'[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}} {_ISO_TIME}\.(?:[0-9]{{3}}|[0-9]{{6}}){_ISO_OFFSET}'
+    ),
+}
+
+
+@lru_cache(maxsize=8192)
+def _parse_with_format(date_string: str, format_str: str) -> Optional[datetime]:
+    """Parse the date string with a format, returning None if it does not fit."""
+    # fromisoformat is implemented in C; strptime re-tokenizes the format in Python
+    iso_shape = _ISO_FAST_PATH.get(format_str)
+    if iso_shape is not None and iso_shape.fullmatch(date_string):
+        try:
+            return datetime.fromisoformat(date_string)
+        except ValueError:
+            pass
+    
     try:
-        datetime.strptime(date_string, format_str)
-        return True
+        return datetime.strptime(date_string, format_str)
     except (ValueError, TypeError):
-        return False
+        return None
+
+
+def _validate_format(date_string: str, format_str: str) -> bool:
+    """Validate that a format string can parse the date string."""
+    return _parse_with_format(date_string, format_str) is not None
+
+
+def _build_infer_table() -> Dict[tuple, List[str]]:
+    """Enumerate the formats _infer_format_from_parsing tries, in order, per shape.
+    
+    Keyed by (day_first, delimiter, has_time, has_micro, has_tz).
+    """
+    table: Dict[tuple, List[str]] = {}
+    for day_first in (True, False):
+        first, second = ('%d', '%m') if day_first else ('%m', '%d')
+        for delimiter in ('-', '/', '.'):
+            date_formats = [
+                f'{first}{delimiter}{second}{delimiter}%Y',
+                f'{first}{delimiter}{second}{delimiter}%y',
+            ]
+            table[(day_first, delimiter, False, False, False)] = date_formats
+            for has_micro, time_format in ((True, ' %H:%M:%S.%f'), (False, ' %H:%M:%S')):
+                for has_tz in (True, False):
+                    suffix = time_format + ('%z' if has_tz else '')
+                    table[(day_first, delimiter, True, has_micro, has_tz)] = [
+                        fmt + suffix for fmt in date_formats
+                    ]
+    return table
+
+
+_INFER_TABLE = _build_infer_table()
 
 
 def _infer_format_from_parsing(date_string: str, locale: str) -> str:
@@ -110,44 +232,52 @@ def _infer_format_from_parsing(date_string: str, locale: str) -> str:
         raise ValueError("Unknown date format")
     
     parts = date_string.split(' ')
-    date_part = parts[0]
-    
-    # Build possible formats
-    possible_formats = []
-    
-    if locale in ['UK', 'EU']:
-        possible_formats.extend([
-            f'%d{delimiter}%m{delimiter}%Y',
-            f'%d{delimiter}%m{delimiter}%y',
-        ])
-    else:  # US
-        possible_formats.extend([
-            f'%m{delimiter}%d{delimiter}%Y',
-            f'%m{delimiter}%d{delimiter}%y',
-        ])
-    
-    # Try each format
-    for fmt in possible_formats:
-        # Add time component if present
-        if len(parts) > 1:
-            time_part = parts[1]
-            if '.' in time_part:
-                full_fmt = f'{fmt} %H:%M:%S.%f'
-                if '+' in date_string or time_part.endswith('Z'):
-                    full_fmt += '%z'
-            else:
-                full_fmt = f'{fmt} %H:%M:%S'
-                if '+' in date_string:
-                    full_fmt += '%z'
-        else:
-            full_fmt = fmt
-        
-        if _validate_format(date_string, full_fmt):
-            return full_fmt
+    
+    # Time component: microseconds if the time has a '.', offset if there's a '+'
+    # (or, with microseconds, a trailing 'Z')
+    has_time = len(parts) > 1
+    has_micro = has_time and '.' in parts[1]
+    has_tz = has_time and ('+' in date_string or (has_micro and parts[1].endswith('Z')))
+    
+    key = (locale in ['UK', 'EU'], delimiter, has_time, has_micro, has_tz)
+    for fmt in _INFER_TABLE[key]:
+        if _validate_format(date_string, fmt):
+            return fmt
     
     raise ValueError("Could not infer date format")
 
 
+@lru_cache(maxsize=4096)
+def _detect_format_only(date_string: str, locale: str) -> str:
+    """Detect the format of a stripped date string; cached per (string, locale)."""
+    # Check for text-based dates (e.g., "13 October 2024", "July 8th 2022")
+    text_format = _detect_text_date(date_string)
+    if text_format:
+        return text_format
+    
+    # Try known patterns: the character-class signature resolves most inputs
+    # with one dict lookup, the regex alternation only runs on a miss
+    candidates = _SIGNATURE_TO_PATTERNS.get(date_string.translate(_SIGNATURE_TABLE))
+    if candidates is None:
+        candidates = _matching_pattern_indices(date_string)
+    
+    for idx in candidates:
+        format_str = FORMAT_PATTERNS[idx][1]
+        if format_str is None:
+            # Ambiguous format, needs locale
+            format_str = _resolve_ambiguous_format(date_string, locale)
+        
+        # Verify the format works
+        if _validate_format(date_string, format_str):
+            return format_str
+    
+    # Fallback: try to parse and infer
+    try:
+        return _infer_format_from_parsing(date_string, locale)
+    except Exception as e:
+        raise ValueError(f"Unable to detect date format for '{date_string}': {e}")
+
+
 def detect_date_format(
     date_string: str,
     formats_set: Set[str],
@@ -178,33 +308,41 @@ def detect_date_format(
         >>> len(formats)
         2
     """
-    date_string = date_string.strip()
+    # Interned so the known_formats scans in normalize_date compare by identity
+    format_str = sys.intern(_detect_format_only(date_string.strip(), locale))
+    formats_set.add(format_str)
+    return format_str
+
+
+def detect_and_parse(
+    date_string: str,
+    formats_set: Set[str],
+    locale: Literal['UK', 'EU', 'US'] = 'US'
+) -> Tuple[str, datetime]:
+    """
+    Detect the date format of a date string and parse it with that format.
     
-    # Check for text-based dates (e.g., "13 October 2024", "July 8th 2022")
-    text_format = _detect_text_date(date_string)
-    if text_format:
-        formats_set.add(text_format)
-        return text_format
+    Detection already parses the string to validate the format, so the parsed
+    datetime comes back with it instead of running strptime a second time.
     
-    # Try known patterns
-    for pattern, format_str in FORMAT_PATTERNS:
-        if re.match(pattern, date_string):
-            if format_str is None:
-                # Ambiguous format, needs locale
-                format_str = _resolve_ambiguous_format(date_string, locale)
-            
-            # Verify the format works
-            if _validate_format(date_string, format_str):
-                formats_set.add(format_str)
-                return format_str
+    Args:
+        date_string: String containing a date or datetime
+        formats_set: Set to store all encountered date formats (modified in-place)
+        locale: Locale hint for ambiguous formats ('UK', 'EU', or 'US')
     
-    # Fallback: try to parse and infer
-    try:
-        inferred_format = _infer_format_from_parsing(date_string, locale)
-        formats_set.add(inferred_format)
-        return inferred_format
-    except Exception as e:
-        raise ValueError(f"Unable to detect date format for '{date_string}': {e}")
+    Returns:
+        Tuple of (detected format, parsed datetime)
+    
+    Raises:
+        ValueError: If the format cannot be determined or does not parse the string
+    """
+    format_str = detect_date_format(date_string, formats_set, locale)
+    date_string = date_string.strip()
+    parsed_date = _parse_with_format(date_string, format_str)
+    if parsed_date is None:
+        # Detected but unparseable (e.g. 'July 8th 2022'): surface strptime's error
+        parsed_date = datetime.strptime(date_string, format_str)
+    return format_str, parsed_date
 
 
 def normalize_date(
@@ -243,17 +381,14 @@ def normalize_date(
     
     # Try parsing with known formats first
     for fmt in known_formats:
-        try:
-            parsed_date = datetime.strptime(date_string, fmt)
+        parsed_date = _parse_with_format(date_string, fmt)
+        if parsed_date is not None:
             break
-        except (ValueError, TypeError):
-            continue
     
     # If not parsed with known formats, try to detect the format
     if parsed_date is None:
         try:
-            detected_format = detect_date_format(date_string, known_formats, locale)
-            parsed_date = datetime.strptime(date_string, detected_format)
+            _, parsed_date = detect_and_parse(date_string, known_formats, locale)
         except Exception as e:
             raise ValueError(f"Unable to parse date '{date_string}': {e}")
     
@@ -265,6 +400,147 @@ def normalize_date(
         raise ValueError(f"Unable to format date to '{desired_format}': {e}")
 
 
+def detect_date_formats_batch(
+    date_strings: List[str],
+    formats_set: Set[str],
+    locale: Literal['UK', 'EU', 'US'] = 'US'
+) -> List[Optional[str]]:
+    """
+    Detect the date format of many date strings, adding each to the formats set.
+    
+    Each distinct string is detected once. Entries whose format cannot be
+    determined come back as None instead of raising.
+    
+    Args:
+        date_strings: Strings containing dates or datetimes
+        formats_set: Set to store all encountered date formats (modified in-place)
+        locale: Locale hint for ambiguous formats ('UK', 'EU', or 'US')
+    
+    Returns:
+        List of detected formats, aligned with date_strings
+    """
+    formats_by_string: Dict[str, Optional[str]] = {}
+    for date_string in date_strings:
+        if date_string not in formats_by_string:
+            try:
+                formats_by_string[date_string] = detect_date_format(date_string, formats_set, locale)
+            except ValueError:
+                formats_by_string[date_string] = None
+    
+    return [formats_by_string[date_string] for date_string in date_strings]
+
+
+def _parse_bucket(bucket, fmt: str, pd):
+    """Parse a bucket (pandas Series) with one format; NaT where it does not fit.
+    
+    Formats with %z are checked with strptime instead: pandas can't hold mixed
+    UTC offsets in one column, and those buckets are never parsed as a whole.
+    """
+    if '%z' in fmt:
+        return pd.Series([_parse_with_format(value, fmt) for value in bucket], dtype=object)
+    return pd.to_datetime(bucket, format=fmt, errors='coerce')
+
+
+def _normalize_or_none(
+    date_string: str,
+    known_formats: Set[str],
+    desired_format: str,
+    locale: str
+) -> Optional[str]:
+    """normalize_date, returning None instead of raising ValueError."""
+    try:
+        return normalize_date(date_string, known_formats, desired_format, locale)
+    except ValueError:
+        return None
+
+
+def normalize_dates_batch(
+    date_strings: List[str],
+    known_formats: Set[str],
+    desired_format: str,
+    locale: Literal['UK', 'EU', 'US'] = 'US'
+) -> List[Optional[str]]:
+    """
+    Normalize many date strings to a desired format.
+    
+    Strings are bucketed by character-class signature. Formats of strings that
+    no known format fits are detected first (and added to known_formats); then
+    a bucket that exactly one known format fits is parsed in one
+    pandas.to_datetime call. Buckets that several formats fit (e.g. '%m/%d/%Y'
+    and '%d/%m/%Y'), entries that do not fit their bucket's format, and every
+    entry when pandas is not installed go through normalize_date one by one.
+    Each result equals normalize_date with the final known_formats.
+    
+    Args:
+        date_strings: Strings containing dates or datetimes to normalize
+        known_formats: Set of known date formats from first pass detection
+        desired_format: Target date format (e.g., '%Y-%m-%d')
+        locale: Locale hint for ambiguous formats ('UK', 'EU', or 'US')
+    
+    Returns:
+        List of normalized dates aligned with date_strings, None where parsing failed
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+    
+    date_strings = [date_string.strip() for date_string in date_strings]
+    if pd is None:
+        return [
+            _normalize_or_none(date_string, known_formats, desired_format, locale)
+            for date_string in date_strings
+        ]
+    
+    results: List[Optional[str]] = [None] * len(date_strings)
+    groups: Dict[str, List[int]] = {}
+    for idx, date_string in enumerate(date_strings):
+        groups.setdefault(date_string.translate(_SIGNATURE_TABLE), []).append(idx)
+    buckets = [(indices, pd.Series([date_strings[idx] for idx in indices])) for indices in groups.values()]
+    
+    # Which known formats fit which strings, per bucket. Strings no known format
+    # fits get their format detected up front (adding it to known_formats, as
+    # normalize_date would), so every bucket is judged against the same formats.
+    fits: List[Dict[str, object]] = [{} for _ in buckets]
+    tried: Set[str] = set()
+    while True:
+        new_formats = known_formats - tried
+        if not new_formats:
+            break
+        tried |= new_formats
+        for bucket_fits, (_, bucket) in zip(fits, buckets):
+            for fmt in new_formats:
+                parsed = _parse_bucket(bucket, fmt, pd)
+                if parsed.notna().any():
+                    bucket_fits[fmt] = parsed
+        for bucket_fits, (indices, bucket) in zip(fits, buckets):
+            fitted = pd.Series(False, index=bucket.index)
+            for parsed in bucket_fits.values():
+                fitted |= parsed.notna()
+            for pos in (~fitted).to_numpy().nonzero()[0]:
+                try:
+                    detect_date_format(date_strings[indices[pos]], known_formats, locale)
+                except ValueError:
+                    pass
+    
+    for bucket_fits, (indices, _) in zip(fits, buckets):
+        # normalize_date takes the first known format that parses a string, so
+        # a bucket is only parsed as a whole when a single format fits it
+        if len(bucket_fits) != 1 or '%z' in next(iter(bucket_fits)):
+            for idx in indices:
+                results[idx] = _normalize_or_none(date_strings[idx], known_formats, desired_format, locale)
+            continue
+        
+        formatted = next(iter(bucket_fits.values())).dt.strftime(desired_format)
+        for idx, value in zip(indices, formatted):
+            if isinstance(value, str):
+                results[idx] = value
+            else:
+                results[idx] = _normalize_or_none(date_strings[idx], known_formats, desired_format, locale)
+    
+    return results
+
+
 # Example usage
 if __name__ == '__main__':
     # First pass: detect all formats
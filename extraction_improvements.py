@@ -9,16 +9,133 @@ Implementation priority:
 4. Multi-pass extraction
 """
 
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from functools import lru_cache
+from itertools import product
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Tuple, Callable
 from difflib import SequenceMatcher
 
+# RapidFuzz (optional) scores similarity in C++ with the Indel (true LCS) ratio.
+# That is not SequenceMatcher's ratio (its matching-block heuristic can miss the
+# longest common subsequence), so some pairs score higher and can flip
+# strings_fuzzy_match decisions near the threshold. FUZZY_SCORER=difflib keeps
+# the SequenceMatcher scores even when RapidFuzz is installed.
+try:
+    import numpy as np
+    from rapidfuzz.distance import Indel
+    from rapidfuzz.process import cpdist
+except ImportError:
+    Indel = None
+    cpdist = None
+FUZZY_SCORER = os.getenv('FUZZY_SCORER', 'rapidfuzz')
+_USE_RAPIDFUZZ = Indel is not None and FUZZY_SCORER != 'difflib'
+
+# tiktoken (optional) gives exact prompt token counts; without it they are estimated
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# orjson (optional) parses and serializes JSON faster than the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def enable_queued_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Print this module's progress messages (multi-pass extraction) to stderr.
+    
+    Opt-in for scripts without their own logging setup. Records go through a
+    queue so extraction threads never block on terminal or pipe writes; the
+    returned listener thread does the output and is stopped at exit. Calling
+    it again returns the same listener.
+    """
+    global _log_listener
+    if _log_listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _log_listener = logging.handlers.QueueListener(log_queue, handler)
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        logger.setLevel(level)
+        logger.propagate = False
+    return _log_listener
+
 
 # ============================================================================
 # IMPROVEMENT 1: DATE NORMALIZATION
 # ============================================================================
 
+_ORDINAL_SUFFIX_RE = re.compile(r'(\d+)(st|nd|rd|th)')
+_OF_WORD_RE = re.compile(r'\bof\b', re.IGNORECASE)
+
+_DATE_SEPARATORS = ('-', '.', '/')
+
+# Common date formats to try, grouped by separator (None = month-name formats)
+_DATE_FORMATS_BY_SEPARATOR = {
+    '-': [
+        '%Y-%m-%d',           # 2023-05-27
+        '%d-%m-%Y',           # 27-05-2023
+        '%m-%d-%Y',           # 05-27-2023
+        '%d-%m-%y',           # 27-05-23
+    ],
+    '.': [
+        '%d.%m.%Y',           # 27.05.2023
+        '%m.%d.%Y',           # 05.27.2023
+        '%d.%m.%y',           # 27.05.23
+    ],
+    '/': [
+        '%d/%m/%Y',           # 27/05/2023
+        '%m/%d/%Y',           # 05/27/2023
+        '%Y/%m/%d',           # 2023/05/27
+        '%m/%d/%y',           # 05/27/23
+    ],
+    None: [
+        '%B %d, %Y',          # May 27, 2023
+        '%d %B %Y',           # 27 May 2023
+        '%b %d, %Y',          # May 27, 2023
+        '%d %b %Y',           # 27 May 2023
+    ],
+}
+
+# Digit counts strptime accepts for each numeric directive
+_FIELD_WIDTHS = {'%Y': (4,), '%y': (2,), '%m': (1, 2), '%d': (1, 2)}
+
+
+def _build_numeric_shape_table() -> Dict[tuple, List[str]]:
+    """Map (separator, digit count of each field) to the formats that can parse it."""
+    table = {}
+    for separator, formats in _DATE_FORMATS_BY_SEPARATOR.items():
+        if separator is None:
+            continue
+        for fmt in formats:
+            for widths in product(*(_FIELD_WIDTHS[field] for field in fmt.split(separator))):
+                table.setdefault((separator, widths), []).append(fmt)
+    return table
+
+
+_DATE_FORMATS_BY_SHAPE = _build_numeric_shape_table()
+
+
 def normalize_date(date_str: str) -> Optional[str]:
     """
     Normalize dates to YYYY-MM-DD format for consistent comparison.
@@ -35,37 +152,46 @@ def normalize_date(date_str: str) -> Optional[str]:
     if not date_str or date_str in ['', 'null', 'None', 'N/A']:
         return None
     
+    return _normalize_date_str(str(date_str))
+
+
+@lru_cache(maxsize=8192)
+def _normalize_date_str(date_str: str) -> Optional[str]:
+    """Memoized body of normalize_date for a non-null value's string form."""
     # Clean the string
-    date_str = str(date_str).strip()
+    date_str = date_str.strip()
     
     # Remove ordinal suffixes (1st, 2nd, 3rd, 4th, etc.)
-    date_str = re.sub(r'(\d+)(st|nd|rd|th)', r'\1', date_str)
+    date_str = _ORDINAL_SUFFIX_RE.sub(r'\1', date_str)
     
     # Remove words like "of"
-    date_str = re.sub(r'\bof\b', '', date_str, flags=re.IGNORECASE)
-    
-    # Common date formats to try
-    formats = [
-        '%Y-%m-%d',           # 2023-05-27
-        '%d-%m-%Y',           # 27-05-2023
-        '%m-%d-%Y',           # 05-27-2023
-        '%d.%m.%Y',           # 27.05.2023
-        '%m.%d.%Y',           # 05.27.2023
-        '%d/%m/%Y',           # 27/05/2023
-        '%m/%d/%Y',           # 05/27/2023
-        '%Y/%m/%d',           # 2023/05/27
-        '%B %d, %Y',          # May 27, 2023
-        '%d %B %Y',           # 27 May 2023
-        '%b %d, %Y',          # May 27, 2023
-        '%d %b %Y',           # 27 May 2023
-        '%m/%d/%y',           # 05/27/23
-        '%d-%m-%y',           # 27-05-23
-        '%d.%m.%y',           # 27.05.23
-    ]
+    date_str = _OF_WORD_RE.sub('', date_str)
+    
+    # Only try the formats built around the separator present in the string;
+    # strptime accepts unpadded fields, so the length is not a safe key
+    stripped = date_str.strip()
+    separator = next((sep for sep in _DATE_SEPARATORS if sep in stripped), None)
+    formats = _DATE_FORMATS_BY_SEPARATOR[separator]
+    
+    # For all-numeric dates the field widths pick exactly the formats that can
+    # parse it, so strptime isn't called (and doesn't raise) for the others
+    if separator is not None:
+        parts = stripped.split(separator)
+        if all(part.isascii() and part.isdigit() for part in parts):
+            shape = tuple(map(len, parts))
+            formats = _DATE_FORMATS_BY_SHAPE.get((separator, shape), [])
+            
+            # YYYY-MM-DD only fits '%Y-%m-%d', which the C fromisoformat parses
+            # identically; on failure strptime below rejects it the same way
+            if separator == '-' and shape == (4, 2, 2):
+                try:
+                    return datetime.fromisoformat(stripped).strftime('%Y-%m-%d')
+                except ValueError:
+                    pass
     
     for fmt in formats:
         try:
-            dt = datetime.strptime(date_str.strip(), fmt)
+            dt = datetime.strptime(stripped, fmt)
             return dt.strftime('%Y-%m-%d')
         except ValueError:
             continue
@@ -116,10 +242,29 @@ def dates_match(date1: str, date2: str) -> bool:
 # IMPROVEMENT 2: FUZZY STRING MATCHING
 # ============================================================================
 
+# Currency symbols and thousands separators stripped from amount fields
+_CURRENCY_RE = re.compile(r'[$£€¥,]')
+
+# Field-name keywords (lowercase) used to infer a field's value type
+_DATE_FIELD_KEYWORDS = ('date', 'received', 'incident', 'effective', 'expiry', 'birth', 'dob')
+_AMOUNT_FIELD_KEYWORDS = ('amount', 'premium', 'limit', 'deductible', 'price', 'cost')
+_DATE_MATCH_KEYWORDS = ('date', 'dob', 'birth')
+
+# One compiled alternation per keyword set, so a field name is scanned once per class
+_DATE_FIELD_RE = re.compile('|'.join(map(re.escape, _DATE_FIELD_KEYWORDS)))
+_AMOUNT_FIELD_RE = re.compile('|'.join(map(re.escape, _AMOUNT_FIELD_KEYWORDS)))
+_DATE_MATCH_RE = re.compile('|'.join(map(re.escape, _DATE_MATCH_KEYWORDS)))
+
+
 def fuzzy_string_similarity(str1: str, str2: str) -> float:
     """
     Calculate similarity ratio between two strings.
     Returns value between 0.0 (no match) and 1.0 (perfect match).
+    
+    With RapidFuzz installed this is the Indel normalized similarity, otherwise
+    (or with FUZZY_SCORER=difflib) SequenceMatcher's ratio. The two differ for
+    some pairs (e.g. 0.857 vs 0.714), so match decisions can change with the
+    scorer.
     """
     if not str1 and not str2:
         return 1.0
@@ -134,15 +279,41 @@ def fuzzy_string_similarity(str1: str, str2: str) -> float:
     if s1 == s2:
         return 1.0
     
-    # Use SequenceMatcher for fuzzy comparison
+    # Use RapidFuzz when available, SequenceMatcher otherwise
+    if _USE_RAPIDFUZZ:
+        return Indel.normalized_similarity(s1, s2)
     return SequenceMatcher(None, s1, s2).ratio()
 
 
+def _precompute_similarities(extracted: Dict[str, Any], expected: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Fuzzy similarity for every key where both values are non-null, computed in a
+    single RapidFuzz call. Returns an empty dict when RapidFuzz is not installed
+    (or FUZZY_SCORER=difflib).
+    """
+    if not _USE_RAPIDFUZZ:
+        return {}
+    
+    keys = [k for k, v in expected.items() if v is not None and extracted.get(k) is not None]
+    if not keys:
+        return {}
+    
+    scores = cpdist(
+        [str(extracted[k]) for k in keys],
+        [str(expected[k]) for k in keys],
+        scorer=Indel.normalized_similarity,
+        processor=lambda s: s.strip().lower(),
+        dtype=np.float64
+    )
+    return dict(zip(keys, scores.tolist()))
+
+
 def strings_fuzzy_match(
     str1: str,
     str2: str,
     threshold: float = 0.85,
-    check_substring: bool = True
+    check_substring: bool = True,
+    similarity: Optional[float] = None
 ) -> bool:
     """
     Check if two strings match with fuzzy logic.
@@ -151,6 +322,7 @@ def strings_fuzzy_match(
         str1, str2: Strings to compare
         threshold: Minimum similarity ratio (0.0-1.0)
         check_substring: If True, also accept if one is substring of other
+        similarity: Precomputed fuzzy_string_similarity(str1, str2), if available
     
     Returns:
         bool: True if strings match within threshold
@@ -168,21 +340,25 @@ def strings_fuzzy_match(
     if s1 == s2:
         return True
     
-    # Fuzzy similarity
-    similarity = fuzzy_string_similarity(s1, s2)
-    if similarity >= threshold:
-        return True
+    # Only the shorter string can be a substring of the longer one
+    shorter, longer = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    min_len, max_len = len(shorter), len(longer)
     
     # Substring check (for cases like "ABC Corp" vs "ABC Corporation Ltd")
-    if check_substring:
-        if s1 in s2 or s2 in s1:
-            # Only accept if shorter string is at least 60% of longer
-            min_len = min(len(s1), len(s2))
-            max_len = max(len(s1), len(s2))
-            if min_len / max_len >= 0.6:
-                return True
+    # Only accept if shorter string is at least 60% of longer. str.__contains__
+    # is far cheaper than the similarity ratio, so it runs first
+    if check_substring and min_len / max_len >= 0.6 and shorter in longer:
+        return True
     
-    return False
+    # Fuzzy similarity. The ratio is 2*matches/(len1+len2) and matches can't
+    # exceed the shorter length, so skip computing it when that bound is too low
+    if similarity is None and 2.0 * min_len / (min_len + max_len) >= threshold:
+        if _USE_RAPIDFUZZ:
+            similarity = Indel.normalized_similarity(s1, s2, score_cutoff=threshold)
+        else:
+            similarity = fuzzy_string_similarity(s1, s2)
+    
+    return similarity is not None and similarity >= threshold
 
 
 def normalize_value_for_comparison(value: Any, field_name: str = "") -> Any:
@@ -196,27 +372,27 @@ def normalize_value_for_comparison(value: Any, field_name: str = "") -> Any:
     Returns:
         Normalized value
     """
+    field_lower = field_name.lower()
+    is_date = _DATE_FIELD_RE.search(field_lower) is not None
+    is_amount = not is_date and _AMOUNT_FIELD_RE.search(field_lower) is not None
+    return _normalize_typed_value(value, is_date, is_amount)
+
+
+def _normalize_typed_value(value: Any, is_date: bool, is_amount: bool) -> Any:
+    """normalize_value_for_comparison with the field-type checks already done."""
     if value is None or value in ['', 'null', 'None', 'N/A']:
         return None
     
     # Convert to string
     value_str = str(value).strip()
     
-    # Check if it's a date field
-    date_keywords = ['date', 'received', 'incident', 'effective', 'expiry', 'birth', 'dob']
-    is_date = any(kw in field_name.lower() for kw in date_keywords)
-    
     if is_date:
         normalized = normalize_date(value_str)
         return normalized if normalized else value_str
     
-    # Check if it's a number/amount field
-    amount_keywords = ['amount', 'premium', 'limit', 'deductible', 'price', 'cost']
-    is_amount = any(kw in field_name.lower() for kw in amount_keywords)
-    
     if is_amount:
         # Remove currency symbols and commas
-        cleaned = re.sub(r'[$£€¥,]', '', value_str)
+        cleaned = _CURRENCY_RE.sub('', value_str)
         try:
             return float(cleaned)
         except:
@@ -249,13 +425,17 @@ def compare_extracted_with_expected_IMPROVED(
     Returns:
         dict: Comparison results with improved matching
     """
-    # Auto-detect date fields if not provided
-    if date_fields is None:
-        date_fields = []
-        date_keywords = ['date', 'received', 'incident', 'effective', 'expiry', 'birth', 'dob']
-        for key in expected.keys():
-            if any(kw in key.lower() for kw in date_keywords):
-                date_fields.append(key)
+    # Classify every expected field once: (key, expected value, date field,
+    # amount field, compare as dates). Date fields are auto-detected if not provided
+    date_field_set = set(date_fields) if date_fields is not None else None
+    schema = []
+    for key, expected_value in expected.items():
+        key_lower = key.lower()
+        is_date = _DATE_FIELD_RE.search(key_lower) is not None
+        is_amount = not is_date and _AMOUNT_FIELD_RE.search(key_lower) is not None
+        in_date_fields = is_date if date_field_set is None else key in date_field_set
+        compare_dates = in_date_fields or _DATE_MATCH_RE.search(key_lower) is not None
+        schema.append((key, expected_value, is_date, is_amount, compare_dates))
     
     comparison = {
         'matches': 0,
@@ -267,7 +447,10 @@ def compare_extracted_with_expected_IMPROVED(
         'match_types': {}  # Track how each match was achieved
     }
     
-    for key, expected_value in expected.items():
+    # Fuzzy similarities in one batch if RapidFuzz is available, else computed on demand
+    similarities = _precompute_similarities(extracted, expected)
+    
+    for key, expected_value, is_date, is_amount, compare_dates in schema:
         extracted_value = extracted.get(key)
         
         # Both null
@@ -306,27 +489,30 @@ def compare_extracted_with_expected_IMPROVED(
         # Both have values - try different matching strategies
         match_found = False
         match_method = None
+        similarity = similarities.get(key)
         
         # Strategy 1: Exact match (after normalization)
-        norm_extracted = normalize_value_for_comparison(extracted_value, key)
-        norm_expected = normalize_value_for_comparison(expected_value, key)
+        norm_extracted = _normalize_typed_value(extracted_value, is_date, is_amount)
+        norm_expected = _normalize_typed_value(expected_value, is_date, is_amount)
         
         if norm_extracted == norm_expected:
             match_found = True
             match_method = 'exact_match_normalized'
         
         # Strategy 2: Date matching (if it's a date field)
-        elif key in date_fields or any(kw in key.lower() for kw in ['date', 'dob', 'birth']):
+        elif compare_dates:
             if dates_match(str(extracted_value), str(expected_value)):
                 match_found = True
                 match_method = 'date_match'
         
         # Strategy 3: Fuzzy string matching
-        elif strings_fuzzy_match(str(extracted_value), str(expected_value), fuzzy_threshold):
-            match_found = True
-            match_method = 'fuzzy_match'
-            similarity = fuzzy_string_similarity(str(extracted_value), str(expected_value))
-            match_method = f'fuzzy_match_{similarity:.2f}'
+        else:
+            if similarity is None:
+                similarity = fuzzy_string_similarity(str(extracted_value), str(expected_value))
+            if strings_fuzzy_match(str(extracted_value), str(expected_value), fuzzy_threshold,
+                                   similarity=similarity):
+                match_found = True
+                match_method = f'fuzzy_match_{similarity:.2f}'
         
         # Record result
         if match_found:
@@ -340,7 +526,8 @@ def compare_extracted_with_expected_IMPROVED(
             comparison['match_types'][key] = match_method
         else:
             comparison['mismatches'] += 1
-            similarity = fuzzy_string_similarity(str(extracted_value), str(expected_value))
+            if similarity is None:
+                similarity = fuzzy_string_similarity(str(extracted_value), str(expected_value))
             comparison['details'][key] = {
                 'status': 'mismatch',
                 'expected': expected_value,
@@ -362,159 +549,72 @@ def compare_extracted_with_expected_IMPROVED(
 # Focus on addresses and scattered information
 # ============================================================================
 
-def get_enhanced_extraction_prompt(keys_to_extract: List[str]) -> str:
-    """
-    Generate enhanced extraction prompt with better guidance for addresses
-    and scattered information.
-    """
-    
-    keys_formatted = '", "'.join(keys_to_extract)
-    
-    prompt = f"""You are a precision data extraction specialist. Extract SPECIFIC key-value pairs from the document.
-
-CRITICAL RULES:
-1. Extract ONLY the requested keys - no additional keys
-2. NEVER invent, guess, or generate values
-3. If key not found, set value to null
-4. Extract EXACTLY as written in document when possible
-5. For dates, preserve the format from document
-6. For amounts, include currency symbols and formatting
-7. Be THOROUGH - scan ENTIRE document including:
-   - Headers and footers
-   - Tables and forms
-   - Signatures and contact blocks
-   - Quoted text and references
-   - Multiple pages
-
-KEYS TO EXTRACT:
-{keys_formatted}
-
-==================================
-EXTRACTION GUIDELINES BY KEY TYPE:
-==================================
-
-DATE FIELDS (e.g., "loss_date", "incident_date", "date_received", "dob"):
-   - Extract EXACTLY as formatted in document (MM/DD/YYYY, DD-MM-YYYY, "January 15, 2024", etc.)
-   - Look for: section headers, form fields, date stamps, email headers
-   - Common locations: Top of page, form fields labeled "Date:", timestamps
-   - If only partial date present, extract what's available
-   - Accept: "Occurred:", "Effective:", "Incident Date:", etc.
-
-IDENTIFYING NUMBERS (e.g., "claim_number", "policy_number", "case_number"):
-   - Extract complete number including any prefixes, suffixes, or special characters
-   - Look for: explicit labels, reference numbers, tracking IDs
-   - Common locations: Headers, subject lines, reference fields
-   - Include dashes, slashes, and letter prefixes (e.g., "POL-2023-12345")
-   - Watch for: "Claim #:", "Policy No:", "Ref:", "Case ID:"
-
-NAME FIELDS (e.g., "claimant_name", "insured_name", "patient_name"):
-   - Extract FULL name as written (First Last, Last First, First Middle Last, etc.)
-   - Look in: form fields, signatures, contact info, headers
-   - Common locations: 
-     * "Name:" or "Full Name:" fields
-     * Signature blocks
-     * Contact information sections
-     * "Regarding:", "Re:", "Subject:" lines
-   - Include titles if present (Mr., Dr., etc.)
-   - For organizations: extract complete legal name
-
-ADDRESS FIELDS - CRITICAL (e.g., "loss_location", "claimant_address", "property_address"):
-   ADDRESSES ARE OFTEN SCATTERED - LOOK CAREFULLY:
-   
-   For STREET addresses (e.g., "claimant_street", "loss_street"):
-   - Look for: house number + street name + type (St, Ave, Rd, Blvd)
-   - Common locations:
-     * Dedicated "Address:" or "Street:" fields
-     * Contact information blocks
-     * Property description sections
-     * "Location of loss:" fields
-     * Headers with letterhead
-   - Examples: "123 Main Street", "45 Oak Avenue", "2 Mid America Plaza, Suite 200"
-   
-   For CITY fields (e.g., "claimant_city", "loss_city"):
-   - Look in: Address blocks, usually after street, before state/zip
-   - May be on same line as street OR separate line
-   - Check: "City:", "Municipality:", form fields
-   
-   For STATE/PROVINCE fields (e.g., "claimant_state", "loss_state"):
-   - Look for: Full name OR 2-letter abbreviation (CA, NY, IL, ON, BC)
-   - Common formats: "State:", "Province:", "State/Province:"
-   - May be: Separate field OR combined with city (e.g., "Chicago, Illinois")
-   
-   For COUNTRY fields (e.g., "loss_country", "claimant_country"):
-   - Look for: Full country name OR abbreviation (USA, US, Canada, Mexico)
-   - Often in: International forms, letterhead, contact blocks
-   - May be: Implied (if US address, country is "USA" or "United States")
-   
-   For ZIP/POSTAL CODE fields:
-   - Look for: 5-digit (US), 5+4 (US extended), alphanumeric (Canada), etc.
-   - Common locations: End of address, "Zip:", "Postal Code:"
-   
-   MULTI-LINE ADDRESSES:
-   If address spans multiple lines, you may need to extract from:
-   Line 1: Street
-   Line 2: City, State Zip
-   Line 3: Country (if present)
-
-AMOUNTS (e.g., "claim_amount", "premium", "damages", "total_amount"):
-   - Include currency symbols (Use ACTUAL document symbols, like $, €, £, ¥)
-   - Preserve thousands separators and decimal places
-   - Look for: Explicit labels, totals in tables, premium schedules
-   - Common locations: "Amount:", "Total:", "Premium:", financial tables
-   - Watch for: Labels like "Claim:", "Damages:", "Loss:", "Premium:", "Deductible:"
-
-ORGANIZATION NAMES (e.g., "insured_name", "carrier_name", "adjuster_company"):
-   - Extract complete legal/trade name
-   - Look in: Letterhead, policy holder fields, signatures, contact blocks
-   - Include: "Inc.", "LLC", "Ltd.", "Company", etc.
-   - Common locations: Top of document, "Insured:", "Company:", signatures
-
-DESCRIPTIONS (e.g., "incident_description", "diagnosis", "cause_of_loss"):
-   - Extract relevant text - can be a sentence or paragraph
-   - Look in: Narrative sections, description fields, comments
-   - Stay within logical section for that key
-   - Common locations: "Description:", "Details:", "Incident:", "Narrative:"
-   - Do NOT extract entire document - be selective
-   - Limit to 1-3 sentences unless more is clearly needed
-
-YES/NO or CATEGORICAL values:
-   - Extract exact term used in document
-   - Look for: Checkboxes, radio buttons, dropdown values
-   - If box is checked or marked, note that clearly
-
-==================================
-EXTRACTION PROCESS:
-==================================
-
-For EACH requested key:
-
-STEP 1: IDENTIFY KEY TYPE
-   - What type of information is this? (date, name, address, amount, etc.)
-   - What are common labels or section headers for this type?
-
-STEP 2: SCAN DOCUMENT THOROUGHLY
-   - Look for explicit labels first ("Name:", "Address:", "Date:")
-   - Check section headers matching key context
-   - Scan tables and form fields
-   - Check headers, footers, signatures
-   - For addresses: Look in contact blocks, property descriptions, loss locations
-
-STEP 3: EXTRACT VALUE
-   - Extract EXACTLY as it appears (preserve format)
-   - If found multiple places, use the MOST COMPLETE and RELEVANT value
-   - For scattered info (addresses): COMBINE from multiple locations if needed
-
-STEP 4: VERIFY
-   - Does this value make sense for this key?
-   - Is it the MOST RELEVANT value in the document?
-   - For addresses: Did I check ALL possible locations?
-
-If key not found after thorough search -> mark as null
-
-==================================
-EXAMPLE EXTRACTION:
-==================================
-
+# Shared by every extraction prompt: one line per key instead of JSON, which
+# spends far fewer output tokens on quotes, braces and indentation
+_PIPE_OUTPUT_FORMAT = """OUTPUT FORMAT: one line per requested key, exactly key|value
+- Write null as the value when the key is not found
+- Keep each value on one line; replace any | inside a value with /
+- No header, no JSON, no code fences, no prose"""
+
+# Static guidelines; the requested keys go in the final user message
+_ENHANCED_EXTRACTION_INSTRUCTIONS = """Extract the requested keys from the document. Return ONLY key|value lines, no prose.
+
+RULES:
+1. Extract ONLY the requested keys
+2. Never invent or guess values; null if not found
+3. Copy values as written: keep date formats, currency symbols, separators
+4. Scan the whole document: headers, footers, tables, forms, signatures, contact blocks, quoted text, all pages
+
+KEY TYPES:
+
+DATES ("loss_date", "incident_date", "date_received", "dob"):
+- Any format (MM/DD/YYYY, DD-MM-YYYY, "January 15, 2024"); partial dates as available
+- Check: form fields, date stamps, email headers, top of page
+- Labels: "Date:", "Occurred:", "Effective:", "Incident Date:"
+
+IDENTIFIERS ("claim_number", "policy_number", "case_number"):
+- Full number with prefixes, suffixes, dashes, slashes ("POL-2023-12345")
+- Check: headers, subject lines, reference fields
+- Labels: "Claim #:", "Policy No:", "Ref:", "Case ID:"
+
+NAMES ("claimant_name", "insured_name", "patient_name"):
+- Full name as written, with titles (Mr., Dr.)
+- Check: form fields, signature blocks, contact sections, headers
+- Labels: "Name:", "Full Name:", "Regarding:", "Re:", "Subject:"
+
+ORGANIZATIONS ("insured_name", "carrier_name", "adjuster_company"):
+- Complete legal/trade name with "Inc.", "LLC", "Ltd.", "Company"
+- Check: letterhead, top of document, policy holder fields, signatures, contact blocks
+- Labels: "Insured:", "Company:"
+
+ADDRESSES ("loss_location", "claimant_address", "property_address"):
+Often scattered. Check ALL of: "Address:"/"Street:" fields, contact blocks, property descriptions, "Location of loss:", letterhead.
+- Street: number + street name + type (St, Ave, Rd, Blvd); "123 Main Street", "2 Mid America Plaza, Suite 200"
+- City: after street, same or next line; "City:", "Municipality:"
+- State/Province: full name or 2-letter code (CA, NY, IL, ON, BC); may share the city line ("Chicago, Illinois")
+- Country: name or abbreviation (USA, US, Canada, Mexico); US address implies "USA"/"United States"
+- ZIP/Postal: 5-digit, ZIP+4 (US), alphanumeric (Canada); end of address, "Zip:", "Postal Code:"
+- Multi-line: line 1 street; line 2 city, state zip; line 3 country
+
+AMOUNTS ("claim_amount", "premium", "damages", "total_amount"):
+- Keep the document's currency symbol ($, €, £, ¥), thousands separators, decimals
+- Check: table totals, premium schedules, financial tables
+- Labels: "Amount:", "Total:", "Premium:", "Claim:", "Damages:", "Loss:", "Deductible:"
+
+DESCRIPTIONS ("incident_description", "diagnosis", "cause_of_loss"):
+- 1-3 relevant sentences from the matching section, never the whole document
+- Labels: "Description:", "Details:", "Incident:", "Narrative:"
+
+YES/NO or CATEGORICAL:
+- Exact term used; checkboxes, radio buttons, dropdowns; state clearly if checked
+
+PROCESS, per key:
+1. Identify its type and usual labels
+2. Search explicit labels first, then matching sections, tables, headers, footers, signatures
+3. Copy the value exactly; if found in several places use the most complete and relevant; combine scattered address parts
+4. Verify it fits the key; otherwise null
+
+EXAMPLE:
 Document excerpt:
 "Date: May 27, 2023
 Claim Number: CLM-2023-45678
@@ -528,48 +628,170 @@ Zip: 60601
 
 Description: Water damage due to burst pipe on third floor"
 
-For keys ["date_received", "claim_number", "insured_name", "loss_street", "loss_city", "loss_state", "loss_zip", "loss_description"]:
+For keys ["date_received", "claim_number", "insured_name", "loss_street", "loss_city", "loss_state", "loss_zip", "loss_description", "loss_country"]:
+
+date_received|May 27, 2023
+claim_number|CLM-2023-45678
+insured_name|Acme Corporation
+loss_street|123 Main Street
+loss_city|Chicago
+loss_state|Illinois
+loss_zip|60601
+loss_description|Water damage due to burst pipe on third floor
+loss_country|null
 
-{{
-  "date_received": "May 27, 2023",
-  "claim_number": "CLM-2023-45678",
-  "insured_name": "Acme Corporation",
-  "loss_street": "123 Main Street",
-  "loss_city": "Chicago",
-  "loss_state": "Illinois",
-  "loss_zip": "60601",
-  "loss_description": "Water damage due to burst pipe on third floor"
-}}
+""" + _PIPE_OUTPUT_FORMAT
 
-==================================
 
-OUTPUT FORMAT (valid JSON only):
-{{{{
-  "extracted_data": {{{{
-    "key1": "extracted value or null",
-    "key2": "extracted value or null",
-    ...
-  }}}}
-}}}}
+_ENHANCED_EXTRACTION_REQUEST = """KEYS TO EXTRACT:
+{keys_formatted}
+
+Extract the requested keys from the DOCUMENT above NOW. Return ONLY key|value lines, no prose."""
 
-DOCUMENT CONTENT:
-{{document_content}}
+# Every extraction prompt opens with this preamble and the document, so the
+# initial and multi-pass requests for a document share the same prefix and the
+# later ones hit OpenAI's prompt cache for the (long) document
+_DOCUMENT_PREAMBLE = "You are a precision data extraction specialist. The next message is the source DOCUMENT; the extraction instructions follow it."
 
-Extract the requested keys NOW. Return ONLY valid JSON."""
 
-    return prompt
+def _chat_messages(document_content: str, instructions: str, request: str) -> List[Dict[str, Any]]:
+    """Document first as the shared prefix, then the instructions and the per-call request."""
+    return [
+        {"role": "system", "content": [{"type": "text", "text": _DOCUMENT_PREAMBLE}]},
+        {"role": "user", "content": [{"type": "text", "text": f"DOCUMENT:\n{document_content}"}]},
+        {"role": "system", "content": [{"type": "text", "text": instructions}]},
+        {"role": "user", "content": [{"type": "text", "text": request}]}
+    ]
+
+
+def document_cache_key(document_content: str) -> str:
+    """prompt_cache_key routing every request about one document to the same cache."""
+    return 'doc_' + hashlib.sha256(document_content.encode('utf-8')).hexdigest()[:32]
+
+
+@lru_cache(maxsize=256)
+def _enhanced_extraction_request(keys_to_extract: Tuple[str, ...]) -> str:
+    """Request message for a schema, built once per key list and reused as the same string."""
+    return _ENHANCED_EXTRACTION_REQUEST.format_map({
+        'keys_formatted': '", "'.join(keys_to_extract)
+    })
+
+
+def get_enhanced_extraction_prompt(keys_to_extract: List[str], document_content: str) -> List[Dict[str, Any]]:
+    """
+    Generate enhanced extraction prompt with better guidance for addresses
+    and scattered information.
+    
+    Returns chat messages: the document, the static guidelines as a system
+    message, then the keys to extract.
+    """
+    request = _enhanced_extraction_request(tuple(keys_to_extract))
+    
+    return _chat_messages(document_content, _ENHANCED_EXTRACTION_INSTRUCTIONS, request)
 
 
 # ============================================================================
 # IMPROVEMENT 5: MULTI-PASS EXTRACTION FOR MISSING FIELDS
 # ============================================================================
 
+# Keywords assigning a missing field to a focused-extraction group, checked in
+# order; fields matching none go to 'other'
+_FIELD_GROUP_KEYWORDS = {
+    'addresses': ('street', 'city', 'state', 'province', 'zip', 'postal', 'country', 'address', 'location'),
+    'dates': ('date', 'dob', 'birth', 'effective', 'expiry', 'incident'),
+    'names': ('name', 'insured', 'claimant', 'patient'),
+    'numbers': ('number', 'policy', 'claim', 'case', 'id', 'reference'),
+    'amounts': ('amount', 'premium', 'limit', 'deductible', 'cost', 'price'),
+}
+
+# One pattern for all groups: each branch is a lookahead over the whole name, so
+# the branches are tried in group order (not leftmost keyword) and lastgroup is
+# the first group with a keyword anywhere in the name
+_FIELD_GROUP_RE = re.compile(
+    '|'.join(
+        f"(?P<{group_name}>(?=.*(?:{'|'.join(map(re.escape, keywords))})))"
+        for group_name, keywords in _FIELD_GROUP_KEYWORDS.items()
+    ),
+    re.DOTALL
+)
+
+
+def _classify_field(field_lower: str) -> str:
+    """Focused-extraction group of a lowercased field name, 'other' if none."""
+    match = _FIELD_GROUP_RE.match(field_lower)
+    return match.lastgroup if match else 'other'
+
+
+# Terms marking document lines likely to hold a value of each field group, used
+# to trim the document for focused passes (field-name words are added per call)
+_PASSAGE_SEED_TERMS = {
+    'addresses': ('street', 'st.', 'ave', 'road', 'rd.', 'blvd', 'suite', 'city', 'state', 'zip',
+                  'postal', 'country', 'address', 'location', 'premises'),
+    'dates': ('date', 'dob', 'birth', 'effective', 'expiry', 'received', 'occurred', 'incident',
+              'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec', '/'),
+    'names': ('name', 'insured', 'claimant', 'patient', 'policyholder', 'regarding', 're:',
+              'mr.', 'mrs.', 'ms.', 'dr.', 'inc', 'llc', 'ltd', 'company'),
+    'numbers': ('number', 'no.', '#', 'policy', 'claim', 'case', 'id', 'ref', 'reference'),
+    'amounts': ('$', '€', '£', 'usd', 'eur', 'gbp', 'amount', 'total', 'premium', 'limit',
+                'deductible', 'cost', 'price'),
+}
+
+
+def select_relevant_passages(
+    document_content: str,
+    field_groups: Dict[str, List[str]],
+    top_k: int = 20,
+    context_lines: int = 2
+) -> str:
+    """
+    Keep only the document lines most likely to contain the requested fields.
+    
+    Each line is scored by how often it contains the seed terms of the groups
+    and the words of the field names; the top_k lines are kept together with
+    context_lines neighbours on each side, in document order. The whole document
+    is returned when a group has no seed terms ('other') or nothing scores.
+    """
+    terms = set()
+    for group_name, fields in field_groups.items():
+        if not fields:
+            continue
+        if group_name not in _PASSAGE_SEED_TERMS:
+            return document_content
+        terms.update(_PASSAGE_SEED_TERMS[group_name])
+        for field in fields:
+            terms.update(word for word in field.lower().split('_') if len(word) > 2)
+    
+    lines = document_content.split('\n')
+    scores = [sum(line_lower.count(term) for term in terms) for line_lower in map(str.lower, lines)]
+    ranked = sorted((idx for idx, score in enumerate(scores) if score > 0), key=lambda idx: -scores[idx])
+    if not ranked:
+        return document_content
+    
+    keep = set()
+    for idx in ranked[:top_k]:
+        keep.update(range(max(0, idx - context_lines), min(len(lines), idx + context_lines + 1)))
+    
+    passages = []
+    previous = -1
+    for idx in sorted(keep):
+        if idx > previous + 1:
+            passages.append('...')
+        passages.append(lines[idx])
+        previous = idx
+    if previous < len(lines) - 1:
+        passages.append('...')
+    
+    return '\n'.join(passages)
+
+
 def extract_missing_fields_multipass(
     document_content: str,
     initial_extraction: Dict[str, Any],
     keys_to_extract: List[str],
     gpt_client,
-    max_passes: int = 2
+    max_passes: int = 2,
+    combine_groups: bool = True,
+    max_passages: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Perform additional extraction passes for fields that were null in initial pass.
@@ -581,19 +803,28 @@ def extract_missing_fields_multipass(
         keys_to_extract: All keys that should be extracted
         gpt_client: GPT client
         max_passes: Maximum number of additional passes
+        combine_groups: Cover all field types in one request (default); if False,
+            send one focused request per field type, concurrently
+        max_passages: If set, send only this many relevance-ranked document lines
+            (plus context) instead of the whole document; check recall on a
+            sample before enabling, and note the trimmed document no longer
+            shares the cached prefix with the initial extraction
     
     Returns:
         dict: Enhanced extraction results
     """
     enhanced = initial_extraction.copy()
+    data = enhanced['extracted_data']
+    notes = enhanced.setdefault('extraction_notes', {})
+    scores = enhanced.setdefault('confidence_scores', {})
     
     # Find null fields
-    null_fields = [k for k in keys_to_extract if enhanced['extracted_data'].get(k) is None]
+    null_fields = [k for k in keys_to_extract if data.get(k) is None]
     
     if not null_fields:
         return enhanced  # All fields found!
     
-    print(f"   Attempting multi-pass extraction for {len(null_fields)} missing fields...")
+    logger.info("Attempting multi-pass extraction for %d missing fields", len(null_fields))
     
     # Group fields by type for focused extraction
     field_groups = {
@@ -606,169 +837,445 @@ def extract_missing_fields_multipass(
     }
     
     for field in null_fields:
-        field_lower = field.lower()
-        if any(x in field_lower for x in ['street', 'city', 'state', 'province', 'zip', 'postal', 'country', 'address', 'location']):
-            field_groups['addresses'].append(field)
-        elif any(x in field_lower for x in ['date', 'dob', 'birth', 'effective', 'expiry', 'incident']):
-            field_groups['dates'].append(field)
-        elif any(x in field_lower for x in ['name', 'insured', 'claimant', 'patient']):
-            field_groups['names'].append(field)
-        elif any(x in field_lower for x in ['number', 'policy', 'claim', 'case', 'id', 'reference']):
-            field_groups['numbers'].append(field)
-        elif any(x in field_lower for x in ['amount', 'premium', 'limit', 'deductible', 'cost', 'price']):
-            field_groups['amounts'].append(field)
-        else:
-            field_groups['other'].append(field)
+        field_groups[_classify_field(field.lower())].append(field)
+    
+    active_groups = {group_name: fields for group_name, fields in field_groups.items() if fields}
+    if not active_groups:
+        return enhanced
+    
+    logger.info("Focused extraction passes: %s",
+                ", ".join(f"{group_name} ({len(fields)})" for group_name, fields in active_groups.items()),
+                extra={"groups": {group_name: len(fields) for group_name, fields in active_groups.items()}})
+    
+    def focused_document(groups: Dict[str, List[str]]) -> str:
+        if max_passages is None:
+            return document_content
+        return select_relevant_passages(document_content, groups, top_k=max_passages)
+    
+    if combine_groups:
+        # One focused extraction covering every group, so the document is sent once
+        document = focused_document(active_groups)
+        combined = _focused_extraction_or_none(
+            document, lambda doc: get_combined_focused_prompt(doc, active_groups), gpt_client, 'all groups'
+        )
+        group_results = {group_name: combined for group_name in active_groups}
+    else:
+        # Independent requests, so run them side by side rather than one after another
+        documents = {
+            group_name: focused_document({group_name: fields})
+            for group_name, fields in active_groups.items()
+        }
+        with ThreadPoolExecutor(max_workers=len(active_groups)) as executor:
+            futures = {
+                group_name: executor.submit(
+                    _focused_extraction_or_none,
+                    documents[group_name],
+                    lambda doc, fields=fields, group_name=group_name: get_focused_extraction_prompt(doc, fields, group_name),
+                    gpt_client, group_name
+                )
+                for group_name, fields in active_groups.items()
+            }
+        group_results = {group_name: future.result() for group_name, future in futures.items()}
     
-    # Try focused extraction for each group
-    for group_name, fields in field_groups.items():
-        if not fields:
+    # Update enhanced results with newly found fields
+    for group_name, fields in active_groups.items():
+        focused_extraction = group_results[group_name]
+        if focused_extraction is None:
             continue
         
-        print(f"      Focused extraction pass for {group_name}: {len(fields)} fields")
-        
-        focused_prompt = get_focused_extraction_prompt(document_content, fields, group_name)
-        
         try:
-            focused_extraction = extract_with_gpt(focused_prompt, gpt_client)
-            
-            # Update enhanced results with newly found fields
+            focused_data = focused_extraction['extracted_data']
+            found = {}
             for field in fields:
-                if field in focused_extraction['extracted_data']:
-                    value = focused_extraction['extracted_data'][field]
-                    if value is not None:
-                        enhanced['extracted_data'][field] = value
-                        enhanced['extraction_notes'][field] = f'Found in multi-pass ({group_name})'
-                        enhanced['confidence_scores'][field] = 0.7  # Lower confidence for multi-pass
-                        print(f"Found {field}: {value}")
+                value = focused_data.get(field)
+                if value is not None:
+                    data[field] = value
+                    notes[field] = f'Found in multi-pass ({group_name})'
+                    scores[field] = 0.7  # Lower confidence for multi-pass
+                    found[field] = value
+            
+            if found:
+                logger.info("multipass %s found %d: %s", group_name, len(found), found,
+                            extra={"group": group_name, "found": found})
         
         except Exception as e:
-            print(f"Error in focused extraction for {group_name}: {e}")
+            logger.error("Error in focused extraction for %s: %s", group_name, e)
     
     return enhanced
 
 
-def get_focused_extraction_prompt(document_content: str, fields: List[str], field_type: str) -> str:
+def _focused_extraction_or_none(
+    document_content: str,
+    build_messages: Callable[[str], List[Dict[str, Any]]],
+    gpt_client,
+    label: str
+) -> Optional[Dict]:
+    """extract_with_gpt_chunked for a multi-pass request; failures are reported and give None."""
+    if count_message_tokens(build_messages(document_content)) > _FOCUSED_PROMPT_WARN_TOKENS:
+        logger.warning("Focused prompt for %s exceeds %d tokens; consider max_passages to trim the document",
+                       label, _FOCUSED_PROMPT_WARN_TOKENS)
+    try:
+        return extract_with_gpt_chunked(document_content, build_messages, gpt_client)
+    except Exception as e:
+        logger.error("Error in focused extraction for %s: %s", label, e)
+        return None
+
+
+_FOCUSED_OUTPUT_FORMAT = "\n\n" + _PIPE_OUTPUT_FORMAT
+
+# Label and guidance per field type, shared by the single-type and combined prompts
+_FOCUSED_FIELD_TYPES = {
+    'addresses': ('ADDRESS fields', """Often scattered; combine parts across lines as needed.
+- Street: building number + street name + type (St, Ave, Rd)
+- City: after the street, same or next line
+- State/Province: full name or 2-letter code (IL, CA, NY, ON)
+- Country: full name (United States, Mexico, Canada)
+- ZIP/Postal: 5 digits (US) or alphanumeric (Canada)
+
+CHECK: letterhead/headers, contact blocks, "Location of loss:"/"Property address:", signature blocks, "Address:"/"Location:"/"Premises:" fields, after "Insured:"/"Claimant:"/"Property Owner:" labels"""),
+    
+    'dates': ('DATE fields', """Any format (MM/DD/YYYY, DD-MM-YYYY, YYYY-MM-DD, "January 15, 2024", "15 Jan 2024"), including timestamps.
+
+CHECK: top of document, email headers, "Date:"/"Effective:"/"Incident Date:" fields, after "Occurred on:"/"Date of Loss:"/"Date Received:", near signatures (date signed)"""),
+    
+    'names': ('NAME fields', """People, companies, organizations. Full names with titles, middle names, suffixes.
+
+CHECK: letterhead, "Name:"/"Insured:"/"Claimant:" fields, signature blocks, "Regarding:"/"Re:"/"Subject:" lines, contact information, after "Patient:"/"Injured Party:"/"Policyholder:" labels"""),
+    
+    'numbers': ('POLICY/CLAIM/CASE NUMBERS', """Include all prefixes, dashes, suffixes.
+
+CHECK: headers, subject lines, reference fields, after "Policy #:"/"Claim No:"/"Case ID:"/"Reference:", barcode and tracking numbers"""),
+    
+    'amounts': ('MONETARY AMOUNTS', """Include currency symbols ($, €, £) and formatting.
+
+CHECK: financial tables, premium schedules, after "Amount:"/"Total:"/"Premium:"/"Limit:"/"Deductible:", loss/claim amounts, policy limits""")
+}
+
+# Complete system message per field type, built once at import
+_FOCUSED_INSTRUCTIONS = {
+    field_type: f"\nFOCUSED TASK: Extract {label} only.\n{guidance}" + _FOCUSED_OUTPUT_FORMAT
+    for field_type, (label, guidance) in _FOCUSED_FIELD_TYPES.items()
+}
+_DEFAULT_FOCUSED_INSTRUCTIONS = "Extract the following fields carefully:" + _FOCUSED_OUTPUT_FORMAT
+
+_FOCUSED_EXTRACTION_REQUEST = 'FIELDS TO EXTRACT:\n"{fields_str}"'
+
+_COMBINED_FOCUSED_TASK = "FOCUSED TASK: Extract the fields listed under each heading in the request, using the guidance for that heading."
+
+_COMBINED_FOCUSED_REQUEST = """FIELDS TO EXTRACT:
+{field_lists}"""
+
+
+def get_focused_extraction_prompt(document_content: str, fields: List[str], field_type: str) -> List[Dict[str, Any]]:
     """
     Generate a highly focused prompt for specific field types.
+    
+    Returns chat messages: the document, the field-type instructions as a
+    system message, then the fields to extract.
     """
+    instructions = _FOCUSED_INSTRUCTIONS.get(field_type, _DEFAULT_FOCUSED_INSTRUCTIONS)
+    request = _FOCUSED_EXTRACTION_REQUEST.format_map({'fields_str': '", "'.join(fields)})
     
-    type_instructions = {
-        'addresses': """
-FOCUSED TASK: Extract ADDRESS fields only.
+    return _chat_messages(document_content, instructions, request)
 
-These fields are CRITICAL and often scattered across the document:
-- Street addresses: Look for house/building number + street name + type (St, Ave, Rd)
-- Cities: Usually follow street address, may be on separate line
-- States/Provinces: Look for full name OR 2-letter code (IL, CA, NY, ON)
-- Countries: Look for full country name (United States, Mexico, Canada)
-- ZIP/Postal codes: 5-digit numbers (US) or alphanumeric (Canada)
 
-WHERE TO LOOK:
-1. Letterhead and headers (company address often at top)
-2. Contact information blocks
-3. "Location of loss:" or "Property address:" sections
-4. Signature blocks (claimant address often near signature)
-5. Form fields labeled "Address:", "Location:", "Premises:"
-6. After "Insured:", "Claimant:", "Property Owner:"
+def get_combined_focused_prompt(document_content: str, field_groups: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+    """
+    Generate one focused prompt covering several field types.
+    
+    After the document, a system message carries the guidance for each
+    non-empty group and the request lists the fields under the same headings.
+    """
+    sections = [_COMBINED_FOCUSED_TASK]
+    field_lists = []
+    
+    for field_type, fields in field_groups.items():
+        if not fields:
+            continue
+        label, guidance = _FOCUSED_FIELD_TYPES.get(field_type, (f'{field_type.upper()} fields', None))
+        if guidance:
+            sections.append(f"## {label}\n{guidance}")
+        fields_str = '", "'.join(fields)
+        field_lists.append(f'## {label}\n"{fields_str}"')
+    
+    instructions = '\n\n'.join(sections) + _FOCUSED_OUTPUT_FORMAT
+    request = _COMBINED_FOCUSED_REQUEST.format_map({'field_lists': '\n'.join(field_lists)})
+    
+    return _chat_messages(document_content, instructions, request)
 
-IMPORTANT: Addresses may span multiple lines. Combine information as needed.""",
-        
-        'dates': """
-FOCUSED TASK: Extract DATE fields only.
-
-Look for dates in ANY format:
-- MM/DD/YYYY, DD-MM-YYYY, YYYY-MM-DD
-- "January 15, 2024", "15 Jan 2024", "Jan 15, 2024"
-- Timestamps, received dates, incident dates
-
-WHERE TO LOOK:
-1. Top of document (date received, document date)
-2. Email headers and timestamps
-3. Form fields labeled "Date:", "Effective:", "Incident Date:"
-4. After "Occurred on:", "Date of Loss:", "Date Received:"
-5. Near signatures (date signed)""",
-        
-        'names': """
-FOCUSED TASK: Extract NAME fields only.
 
-Look for person names, company names, organization names.
+# Prompt token budget: gpt-4o's context window minus room for the response
+_CONTEXT_TOKEN_LIMIT = 128000
+_OUTPUT_TOKEN_RESERVE = 2048
+_PROMPT_TOKEN_BUDGET = _CONTEXT_TOKEN_LIMIT - _OUTPUT_TOKEN_RESERVE
+_FOCUSED_PROMPT_WARN_TOKENS = 8000
+_CHARS_PER_TOKEN = 4  # estimate used when tiktoken is not installed
 
-WHERE TO LOOK:
-1. Letterhead (company names)
-2. Form fields labeled "Name:", "Insured:", "Claimant:"
-3. Signature blocks
-4. "Regarding:", "Re:", "Subject:" lines
-5. Contact information
-6. After "Patient:", "Injured Party:", "Policyholder:"
 
-Extract FULL names including titles, middle names, suffixes.""",
-        
-        'numbers': """
-FOCUSED TASK: Extract POLICY/CLAIM/CASE NUMBERS only.
+@lru_cache(maxsize=1)
+def _token_encoding():
+    """gpt-4o tokenizer, or None when tiktoken or its encoding file is unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception:
+        return None
 
-Look for alphanumeric identifiers.
 
-WHERE TO LOOK:
-1. Top of document, headers
-2. Subject lines
-3. Reference fields
-4. After "Policy #:", "Claim No:", "Case ID:", "Reference:"
-5. Barcode numbers, tracking numbers
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Prompt tokens of chat messages (estimated from length without tiktoken)."""
+    encoding = _token_encoding()
+    total = 0
+    for message in messages:
+        total += 4  # per-message framing
+        for part in message['content']:
+            text = part.get('text', '')
+            total += len(encoding.encode(text)) if encoding else len(text) // _CHARS_PER_TOKEN + 1
+    return total
+
+
+# Completions of deterministic (temperature 0) extraction requests, keyed by a
+# hash of the request and the client's model and endpoint: kept in memory and
+# as one file per request on disk
+_RESPONSE_CACHE_DIR = Path('.extract_cache')
+_RESPONSE_CACHE_TTL = 7 * 24 * 3600  # seconds
+_RESPONSE_CACHE_SIZE = 4096
+_response_cache: Dict[str, str] = {}
+_response_cache_lock = threading.Lock()  # extract_with_gpt runs on several threads
+
+
+def _response_cache_key(json_data: Dict[str, Any], gpt_client) -> str:
+    """Hash of the request body plus the client's model and endpoint; key order doesn't change it."""
+    keyed = {
+        "model": getattr(gpt_client, 'model', None),
+        "url": gpt_client.chat_completions_url,
+        "request": json_data
+    }
+    # Both serializations are compact, sorted and UTF-8, so keys match with or without orjson
+    if orjson is not None:
+        payload = orjson.dumps(keyed, option=orjson.OPT_SORT_KEYS)
+    else:
+        payload = json.dumps(keyed, sort_keys=True, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _remember_response(cache_key: str, content: str):
+    """Keep a completion in memory, evicting the oldest entry when full."""
+    with _response_cache_lock:
+        if len(_response_cache) >= _RESPONSE_CACHE_SIZE:
+            _response_cache.pop(next(iter(_response_cache)), None)
+        _response_cache[cache_key] = content
+
+
+def _load_cached_response(cache_key: str) -> Optional[str]:
+    """Return a cached completion from memory or an unexpired disk entry."""
+    content = _response_cache.get(cache_key)
+    if content is not None:
+        return content
+    
+    cache_path = _RESPONSE_CACHE_DIR / f'{cache_key}.json'
+    try:
+        if time.time() - cache_path.stat().st_mtime < _RESPONSE_CACHE_TTL:
+            content = cache_path.read_text(encoding='utf-8')
+            _remember_response(cache_key, content)
+            return content
+    except OSError:
+        pass
+    return None
 
-Include ALL parts: prefixes, dashes, suffixes.""",
-        
-        'amounts': """
-FOCUSED TASK: Extract MONETARY AMOUNTS only.
 
-Look for currency values with symbols.
+def _store_cached_response(cache_key: str, content: str):
+    """Cache a completion in memory and on disk (disk errors are ignored)."""
+    _remember_response(cache_key, content)
+    try:
+        _RESPONSE_CACHE_DIR.mkdir(exist_ok=True)
+        (_RESPONSE_CACHE_DIR / f'{cache_key}.json').write_text(content, encoding='utf-8')
+    except OSError:
+        pass
 
-WHERE TO LOOK:
-1. Financial tables
-2. Premium schedules
-3. After "Amount:", "Total:", "Premium:", "Limit:", "Deductible:"
-4. Loss amounts, claim amounts, policy limits
 
-Include currency symbols ($, €, £) and formatting."""
-    }
+def extract_with_gpt(
+    messages: List[Dict[str, Any]],
+    gpt_client,
+    prompt_cache_key: Optional[str] = None,
+    temperature: float = 0.0,
+    bypass_cache: bool = False
+) -> Dict:
+    """
+    Wrapper for GPT extraction with error handling.
+    
+    Requests at temperature 0 are answered from the response cache when the
+    same request was made before (in this process, or on disk within a week).
     
-    instruction = type_instructions.get(field_type, "Extract the following fields carefully:")
-    fields_str = '", "'.join(fields)
+    Args:
+        messages: Chat messages from one of the prompt builders above
+        gpt_client: Your SecureGPT client object (with .request() method)
+        prompt_cache_key: Stable key for requests sharing a prefix, e.g.
+            document_cache_key(document_content), so they reach the same prompt cache
+        temperature: Sampling temperature; only 0 is cached
+        bypass_cache: Always call the model (the fresh result is still cached)
     
-    prompt = f"""{instruction}
+    Returns:
+        dict with extracted_data (the model's key -> value lines) and the
+        confidence_scores and extraction_notes derived from it
+    """
+    extraction_json_data = {
+        "messages": messages,
+        "temperature": temperature
+    }
+    if prompt_cache_key:
+        extraction_json_data["prompt_cache_key"] = prompt_cache_key
+    
+    # Fail before the round trip rather than after it
+    prompt_tokens = count_message_tokens(messages)
+    if prompt_tokens > _PROMPT_TOKEN_BUDGET:
+        raise ValueError(f"Prompt is {prompt_tokens} tokens, over the {_PROMPT_TOKEN_BUDGET}-token budget; "
+                         f"use extract_with_gpt_chunked to split the document")
+    
+    cacheable = temperature == 0
+    cache_key = _response_cache_key(extraction_json_data, gpt_client) if cacheable else None
+    gpt_result = None
+    if cacheable and not bypass_cache:
+        gpt_result = _load_cached_response(cache_key)
+    
+    if gpt_result is None:
+        gpt_response = gpt_client.request(
+            json_data=extraction_json_data,
+            url=gpt_client.chat_completions_url
+        )
+        gpt_result = gpt_response['choices'][0]['message']['content']
+        if cacheable:
+            _store_cached_response(cache_key, gpt_result)
+    
+    return _extraction_result(parse_extraction_response(gpt_result))
+
+
+def _extraction_result(extracted_data: Dict[str, Any]) -> Dict:
+    """Wrap extracted values; the model only returns values, so confidence and notes are derived here."""
+    return {
+        'extracted_data': extracted_data,
+        'confidence_scores': {
+            key: 1.0 if value is not None else 0.0 for key, value in extracted_data.items()
+        },
+        'extraction_notes': {
+            key: 'Extracted' if value is not None else 'Key not found' for key, value in extracted_data.items()
+        }
+    }
 
-FIELDS TO EXTRACT:
-"{fields_str}"
 
-DOCUMENT:
-{document_content}
+def _split_document_in_half(document_content: str) -> Optional[Tuple[str, str]]:
+    """Split at the paragraph (else line) break nearest the middle; None if too short."""
+    if len(document_content) < 2:
+        return None
+    
+    middle = len(document_content) // 2
+    for separator in ('\n\n', '\n'):
+        before = document_content.rfind(separator, 0, middle)
+        after = document_content.find(separator, middle)
+        candidates = [idx for idx in (before, after) if idx > 0]
+        if candidates:
+            split_at = min(candidates, key=lambda idx: abs(idx - middle))
+            return document_content[:split_at], document_content[split_at + len(separator):]
+    
+    return document_content[:middle], document_content[middle:]
 
-Return ONLY valid JSON:
-{{{{
-  "extracted_data": {{{{
-    "field1": "value or null",
-    "field2": "value or null",
-    ...
-  }}}}
-}}}}"""
+
+def extract_with_gpt_chunked(
+    document_content: str,
+    build_messages: Callable[[str], List[Dict[str, Any]]],
+    gpt_client
+) -> Dict:
+    """
+    extract_with_gpt for a prompt built around a document, split to fit the context.
     
-    return prompt
+    If build_messages(document_content) is over the token budget the document is
+    halved at a paragraph break and each half extracted (recursively); for each
+    key the first non-null value in document order is kept.
+    """
+    messages = build_messages(document_content)
+    if count_message_tokens(messages) <= _PROMPT_TOKEN_BUDGET:
+        return extract_with_gpt(messages, gpt_client,
+                                prompt_cache_key=document_cache_key(document_content))
+    
+    halves = _split_document_in_half(document_content)
+    if halves is None:
+        raise ValueError(f"Prompt exceeds the {_PROMPT_TOKEN_BUDGET}-token budget even without the document")
+    
+    merged: Dict[str, Any] = {}
+    for half in halves:
+        for key, value in extract_with_gpt_chunked(half, build_messages, gpt_client)['extracted_data'].items():
+            if merged.get(key) is None:
+                merged[key] = value
+    return _extraction_result(merged)
+
+
+def _parse_pipe_line(line: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Split one 'key|value' output line; None for blank, fence or malformed lines."""
+    line = line.strip()
+    if '|' not in line or line.startswith('```'):
+        return None
+    key, value = line.split('|', 1)
+    key = key.strip().strip('"\'`')
+    value = value.strip()
+    if not key:
+        return None
+    return key, None if value.lower() in ('', 'null', 'none') else value
 
 
-def extract_with_gpt(prompt: str, gpt_client) -> Dict:
+def parse_extraction_response(text: str) -> Dict[str, Optional[str]]:
     """
-    Wrapper for GPT extraction with error handling.
+    Parse the model's key|value lines into a dict (null -> None).
+    
+    JSON responses (cached before the switch to key|value lines, or from a model
+    that ignored the format) are still accepted, with or without the old
+    extracted_data wrapper.
     """
-    # This should call your actual GPT extraction function
-    # For now, returning placeholder
-    # Replace with: return your_gpt_extraction_function(prompt, gpt_client)
+    if text.lstrip().startswith('{'):
+        extracted_data = orjson.loads(text) if orjson is not None else json.loads(text)
+        if isinstance(extracted_data.get('extracted_data'), dict):
+            extracted_data = extracted_data['extracted_data']
+        return extracted_data
+    
+    return dict(pair for pair in map(_parse_pipe_line, text.splitlines()) if pair is not None)
+
+
+def _iter_pipe_lines(chunks: Iterable[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """Yield (key, value) from streamed key|value text as each line completes."""
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            pair = _parse_pipe_line(line)
+            if pair is not None:
+                yield pair
+    
+    pair = _parse_pipe_line(buffer)
+    if pair is not None:
+        yield pair
+
+
+def stream_extract_with_gpt(
+    messages: List[Dict[str, Any]],
+    openai_client,
+    model: str = "gpt-4o",
+    temperature: float = 0.0
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Streaming variant of extract_with_gpt for an openai.OpenAI client.
     
-    # Placeholder
-    return {
-        'extracted_data': {},
-        'confidence_scores': {},
-        'extraction_notes': {}
-    }
+    Yields each (key, value) pair as soon as the model has finished its line, so
+    callers can start on early keys while the rest is still being generated.
+    """
+    stream = openai_client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        stream=True
+    )
+    chunks = (chunk.choices[0].delta.content or '' for chunk in stream if chunk.choices)
+    yield from _iter_pipe_lines(chunks)
 
 
 # ============================================================================
@@ -780,6 +1287,8 @@ if __name__ == "__main__":
     Example showing how improvements work together
     """
     
+    enable_queued_logging()
+    
     # Test date normalization
     print("="*70)
     print("TESTING DATE NORMALIZATION")
@@ -1,4 +1,42 @@
+import asyncio
+import atexit
+import hashlib
+import importlib.util
+import json
+import logging
 import os
+import re
+import threading
+import time
+import weakref
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Iterator, List, Optional, Tuple
+
+import httpx
+from tenacity import before_sleep_log, retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+# orjson (optional) parses and serializes JSON faster than the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _json_loads(data):
+    """Parse JSON from str or bytes, with orjson when available."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _json_dumps(obj, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON; with or without orjson the bytes are the same."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, sort_keys=sort_keys, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
 
 # Document labels from your code
 DOCUMENT_LABELS_LEGACY_UPDATED = [
@@ -16,114 +54,104 @@ DOCUMENT_LABELS_LEGACY_UPDATED = [
     "Other"
 ]
 
-
-def classify_document_with_gpt_improved(document_content: str) -> dict:
-    """
-    Enhanced document classification using GPT with improved prompting strategy.
-    
-    This function uses a more detailed prompt with:
-    - Clear structural markers and formatting cues
-    - Enhanced class descriptions with key identifiers
-    - Better reasoning guidance
-    - Multi-stage classification approach
-    
-    Args:
-        document_content: The extracted text content from Azure Document Intelligence
-        
-    Returns:
-        dict: Classification result with label, score, and thinking process
-    """
-    
-    # Enhanced label descriptions with discriminative features
-    label_descriptions = {
-        "Email": {
-            "description": "Email correspondence with standard email structure",
-            "key_markers": ["From:", "To:", "Subject:", "Sent:", "CC:", "email addresses (e.g., user@domain.com)"],
-            "typical_length": "Short to medium (1-3 pages)",
-            "structural_cues": "Headers with sender/recipient info at top, conversational tone",
-            "vocabulary": ["forwarded", "attached", "please find", "regards", "dear", "hi", "hello"]
-        },
-        "Claim Notification / Acord / Notice of Loss / Loss Report / Incident Report": {
-            "description": "Formal notification of an insurance claim, loss, or incident",
-            "key_markers": ["claim number", "loss date", "incident date", "claimant name", "policy number", "ACORD form"],
-            "typical_length": "Medium (2-6 pages)",
-            "structural_cues": "Form-like structure with fields and values, formal reporting language",
-            "vocabulary": ["notifying", "occurred", "damages", "injured party", "circumstances", "date of loss", "claim filing", "incident report", "loss notification"]
-        },
-        "Notice of Claim / Complaint / Claim Letter / Acknowledgement": {
-            "description": "Legal notice or complaint about a claim, or acknowledgement of receipt",
-            "key_markers": ["re:", "complaint", "claim", "acknowledgement", "plaintiff", "defendant", "formal salutation"],
-            "typical_length": "Short to medium (1-4 pages)",
-            "structural_cues": "Letter format with date, addresses, formal opening/closing",
-            "vocabulary": ["hereby", "acknowledge receipt", "complaint filed", "grievance", "dispute", "legal action", "claim acknowledgement"]
-        },
-        "Court Document / Legal Document": {
-            "description": "Official court filings, legal briefs, motions, or judgments",
-            "key_markers": ["case number", "court name", "plaintiff v. defendant", "filed", "docket", "honorable", "motion", "order"],
-            "typical_length": "Medium to long (3-20+ pages)",
-            "structural_cues": "Formal legal structure with numbered paragraphs, case captions, legal citations",
-            "vocabulary": ["wherefore", "pursuant to", "jurisdiction", "affidavit", "testimony", "exhibits", "petitioner", "respondent", "ruling"]
-        },
-        "Medical Document": {
-            "description": "Medical records, doctor's notes, diagnosis reports, treatment plans",
-            "key_markers": ["patient name", "date of birth", "diagnosis", "treatment", "physician", "vital signs", "medications", "ICD codes"],
-            "typical_length": "Variable (1-10 pages)",
-            "structural_cues": "Medical terminology throughout, clinical observations, prescribed treatments",
-            "vocabulary": ["diagnosis", "prognosis", "symptoms", "examination", "prescription", "chief complaint", "medical history", "treatment plan", "physician notes"]
-        },
-        "Police Report / Accident Report": {
-            "description": "Official police or traffic accident reports",
-            "key_markers": ["report number", "officer name", "badge number", "incident location", "date/time of incident", "vehicle information", "witness statements"],
-            "typical_length": "Medium (2-8 pages)",
-            "structural_cues": "Official form format, narrative section, diagram or sketch, officer signature",
-            "vocabulary": ["investigating officer", "accident scene", "vehicle", "collision", "citation", "witness", "statement", "traffic violation", "crash"]
-        },
-        "Bordereau": {
-            "description": "Insurance industry document listing individual risks or claims in tabular format",
-            "key_markers": ["policy numbers in rows", "premium amounts", "risk details", "column headers", "totals/subtotals"],
-            "typical_length": "Medium to long (often multi-page tables)",
-            "structural_cues": "Primarily tabular data with multiple entries, summary rows, often spreadsheet-like",
-            "vocabulary": ["premium", "coverage", "risk", "insured", "policy period", "endorsement", "aggregate", "bordereau"]
-        },
-        "Policy Schedule / Slip / Endorsement / Binder / Certificate": {
-            "description": "Insurance policy documents showing coverage details, terms, and conditions",
-            "key_markers": ["policy number", "coverage limits", "effective dates", "premium", "insured name", "endorsement number", "certificate number"],
-            "typical_length": "Variable (1-20 pages)",
-            "structural_cues": "Structured sections for coverage types, limits, exclusions, often includes tables",
-            "vocabulary": ["coverage", "deductible", "limits", "exclusions", "insured", "insurer", "endorsement", "binder", "certificate holder", "effective period"]
-        },
-        "Claimant List": {
-            "description": "List or roster of claimants, typically in table or list format",
-            "key_markers": ["claimant names", "claim numbers", "amounts", "list structure", "multiple entries"],
-            "typical_length": "Short to medium (1-5 pages)",
-            "structural_cues": "List or table format with consistent entries, column headers if tabular",
-            "vocabulary": ["claimant", "claim amount", "status", "total", "list of claims"]
-        },
-        "Adjuster Report": {
-            "description": "Insurance adjuster's assessment and findings regarding a claim",
-            "key_markers": ["adjuster name", "claim investigation", "findings", "recommendations", "estimate", "inspection date"],
-            "typical_length": "Medium (3-10 pages)",
-            "structural_cues": "Report format with sections (summary, investigation, findings, recommendations)",
-            "vocabulary": ["investigation", "inspection", "estimate", "damage assessment", "adjuster", "findings", "recommendations", "liability", "coverage determination"]
-        },
-        "Interim Invoice": {
-            "description": "Partial or interim billing statement for services or payments",
-            "key_markers": ["invoice number", "invoice date", "amount due", "line items", "payment terms", "interim"],
-            "typical_length": "Short (1-3 pages)",
-            "structural_cues": "Invoice format with itemized charges, totals, payment information",
-            "vocabulary": ["invoice", "billing", "payment", "interim", "balance", "amount due", "line items", "subtotal"]
-        },
-        "Other": {
-            "description": "Documents that don't fit clearly into any above category",
-            "key_markers": ["Mixed content that doesn't match any specific category"],
-            "typical_length": "Variable",
-            "structural_cues": "No clear pattern matching other categories",
-            "vocabulary": ["General business or administrative documents"]
-        }
+# Enhanced label descriptions with discriminative features
+_LABEL_DESCRIPTIONS = {
+    "Email": {
+        "description": "Email correspondence with standard email structure",
+        "key_markers": ["From:", "To:", "Subject:", "Sent:", "CC:", "email addresses (e.g., user@domain.com)"],
+        "typical_length": "Short to medium (1-3 pages)",
+        "structural_cues": "Headers with sender/recipient info at top, conversational tone",
+        "vocabulary": ["forwarded", "attached", "please find", "regards", "dear", "hi", "hello"]
+    },
+    "Claim Notification / Acord / Notice of Loss / Loss Report / Incident Report": {
+        "description": "Formal notification of an insurance claim, loss, or incident",
+        "key_markers": ["claim number", "loss date", "incident date", "claimant name", "policy number", "ACORD form"],
+        "typical_length": "Medium (2-6 pages)",
+        "structural_cues": "Form-like structure with fields and values, formal reporting language",
+        "vocabulary": ["notifying", "occurred", "damages", "injured party", "circumstances", "date of loss", "claim filing", "incident report", "loss notification"]
+    },
+    "Notice of Claim / Complaint / Claim Letter / Acknowledgement": {
+        "description": "Legal notice or complaint about a claim, or acknowledgement of receipt",
+        "key_markers": ["re:", "complaint", "claim", "acknowledgement", "plaintiff", "defendant", "formal salutation"],
+        "typical_length": "Short to medium (1-4 pages)",
+        "structural_cues": "Letter format with date, addresses, formal opening/closing",
+        "vocabulary": ["hereby", "acknowledge receipt", "complaint filed", "grievance", "dispute", "legal action", "claim acknowledgement"]
+    },
+    "Court Document / Legal Document": {
+        "description": "Official court filings, legal briefs, motions, or judgments",
+        "key_markers": ["case number", "court name", "plaintiff v. defendant", "filed", "docket", "honorable", "motion", "order"],
+        "typical_length": "Medium to long (3-20+ pages)",
+        "structural_cues": "Formal legal structure with numbered paragraphs, case captions, legal citations",
+        "vocabulary": ["wherefore", "pursuant to", "jurisdiction", "affidavit", "testimony", "exhibits", "petitioner", "respondent", "ruling"]
+    },
+    "Medical Document": {
+        "description": "Medical records, doctor's notes, diagnosis reports, treatment plans",
+        "key_markers": ["patient name", "date of birth", "diagnosis", "treatment", "physician", "vital signs", "medications", "ICD codes"],
+        "typical_length": "Variable (1-10 pages)",
+        "structural_cues": "Medical terminology throughout, clinical observations, prescribed treatments",
+        "vocabulary": ["diagnosis", "prognosis", "symptoms", "examination", "prescription", "chief complaint", "medical history", "treatment plan", "physician notes"]
+    },
+    "Police Report / Accident Report": {
+        "description": "Official police or traffic accident reports",
+        "key_markers": ["report number", "officer name", "badge number", "incident location", "date/time of incident", "vehicle information", "witness statements"],
+        "typical_length": "Medium (2-8 pages)",
+        "structural_cues": "Official form format, narrative section, diagram or sketch, officer signature",
+        "vocabulary": ["investigating officer", "accident scene", "vehicle", "collision", "citation", "witness", "statement", "traffic violation", "crash"]
+    },
+    "Bordereau": {
+        "description": "Insurance industry document listing individual risks or claims in tabular format",
+        "key_markers": ["policy numbers in rows", "premium amounts", "risk details", "column headers", "totals/subtotals"],
+        "typical_length": "Medium to long (often multi-page tables)",
+        "structural_cues": "Primarily tabular data with multiple entries, summary rows, often spreadsheet-like",
+        "vocabulary": ["premium", "coverage", "risk", "insured", "policy period", "endorsement", "aggregate", "bordereau"]
+    },
+    "Policy Schedule / Slip / Endorsement / Binder / Certificate": {
+        "description": "Insurance policy documents showing coverage details, terms, and conditions",
+        "key_markers": ["policy number", "coverage limits", "effective dates", "premium", "insured name", "endorsement number", "certificate number"],
+        "typical_length": "Variable (1-20 pages)",
+        "structural_cues": "Structured sections for coverage types, limits, exclusions, often includes tables",
+        "vocabulary": ["coverage", "deductible", "limits", "exclusions", "insured", "insurer", "endorsement", "binder", "certificate holder", "effective period"]
+    },
+    "Claimant List": {
+        "description": "List or roster of claimants, typically in table or list format",
+        "key_markers": ["claimant names", "claim numbers", "amounts", "list structure", "multiple entries"],
+        "typical_length": "Short to medium (1-5 pages)",
+        "structural_cues": "List or table format with consistent entries, column headers if tabular",
+        "vocabulary": ["claimant", "claim amount", "status", "total", "list of claims"]
+    },
+    "Adjuster Report": {
+        "description": "Insurance adjuster's assessment and findings regarding a claim",
+        "key_markers": ["adjuster name", "claim investigation", "findings", "recommendations", "estimate", "inspection date"],
+        "typical_length": "Medium (3-10 pages)",
+        "structural_cues": "Report format with sections (summary, investigation, findings, recommendations)",
+        "vocabulary": ["investigation", "inspection", "estimate", "damage assessment", "adjuster", "findings", "recommendations", "liability", "coverage determination"]
+    },
+    "Interim Invoice": {
+        "description": "Partial or interim billing statement for services or payments",
+        "key_markers": ["invoice number", "invoice date", "amount due", "line items", "payment terms", "interim"],
+        "typical_length": "Short (1-3 pages)",
+        "structural_cues": "Invoice format with itemized charges, totals, payment information",
+        "vocabulary": ["invoice", "billing", "payment", "interim", "balance", "amount due", "line items", "subtotal"]
+    },
+    "Other": {
+        "description": "Documents that don't fit clearly into any above category",
+        "key_markers": ["Mixed content that doesn't match any specific category"],
+        "typical_length": "Variable",
+        "structural_cues": "No clear pattern matching other categories",
+        "vocabulary": ["General business or administrative documents"]
     }
-    
-    # Build comprehensive classification prompt
-    classification_prompt = f"""You are an expert document classifier for insurance industry documents. Your task is to classify the provided document into ONE of the following categories.
+}
+
+# Read-only: the prompt text and fast-path patterns are derived from it at import,
+# so changing it later would silently disagree with them
+_LABEL_DESCRIPTIONS = MappingProxyType({
+    label: MappingProxyType(desc) for label, desc in _LABEL_DESCRIPTIONS.items()
+})
+
+
+# The detailed prompt is the same for every document apart from the document
+# itself, so everything before it is built once here
+_CLASSIFICATION_INSTRUCTIONS = """You are an expert document classifier for insurance industry documents. Your task is to classify the provided document into ONE of the following categories.
 
 CLASSIFICATION INSTRUCTIONS:
 1. Read the document content carefully, paying attention to structural features (headers, tables, forms) and keywords.
@@ -137,20 +165,34 @@ CLASSIFICATION INSTRUCTIONS:
 DOCUMENT CATEGORIES AND THEIR CHARACTERISTICS:
 
 """
-    
-    # Add detailed category descriptions
-    for i, label in enumerate(DOCUMENT_LABELS_LEGACY_UPDATED, 1):
-        desc = label_descriptions.get(label, {})
-        classification_prompt += f"""
+
+
+_CATEGORY_SECTION = """
 {i}. {label}
-   Description: {desc.get('description', 'N/A')}
-   Key Markers: {', '.join(desc.get('key_markers', ['N/A']))}
-   Typical Length: {desc.get('typical_length', 'N/A')}
-   Structural Cues: {desc.get('structural_cues', 'N/A')}
-   Common Vocabulary: {', '.join(desc.get('vocabulary', ['N/A']))}
+   Description: {description}
+   Key Markers: {key_markers}
+   Typical Length: {typical_length}
+   Structural Cues: {structural_cues}
+   Common Vocabulary: {vocabulary}
 """
-    
-    classification_prompt += """
+
+_CATEGORY_LINES = [
+    _CATEGORY_SECTION.format(
+        i=i,
+        label=label,
+        description=desc['description'],
+        key_markers=', '.join(desc['key_markers']),
+        typical_length=desc['typical_length'],
+        structural_cues=desc['structural_cues'],
+        vocabulary=', '.join(desc['vocabulary'])
+    )
+    for i, label in enumerate(DOCUMENT_LABELS_LEGACY_UPDATED, 1)
+    for desc in (_LABEL_DESCRIPTIONS[label],)
+]
+_CATEGORY_BLOCK = "".join(_CATEGORY_LINES)
+
+
+_CLASSIFICATION_PROCESS = f"""
 
 CLASSIFICATION PROCESS:
 First, in your thinking, identify:
@@ -160,59 +202,467 @@ First, in your thinking, identify:
 - Which category's description most closely matches these observations?
 
 Then, output the classification result as a JSON object with the following structure:
-{
+{{
     "thinking": "str, your detailed reasoning about structural features, keywords found, and why this category fits best",
     "label": "str, MUST be EXACTLY one of the category names listed above",
     "score": "float between 0 and 1, your confidence in this classification"
-}
+}}
 
 CRITICAL RULES:
 - The 'label' field MUST exactly match one of the {len(DOCUMENT_LABELS_LEGACY_UPDATED)} category names above (case-sensitive).
 - Do NOT use synonyms or variations. Use the exact label text.
 - Provide your reasoning in 'thinking' before deciding on the label.
-- When in doubt between two categories, choose the one with more matching key markers.
+- When in doubt between two categories, choose the one with more matching key markers."""
+
+_CLASSIFICATION_PROMPT_HEAD = _CLASSIFICATION_INSTRUCTIONS + _CATEGORY_BLOCK + _CLASSIFICATION_PROCESS
+_CLASSIFICATION_PROMPT_TAIL = "\n\nDOCUMENT CONTENT:\n"
 
-DOCUMENT CONTENT:
-{document_content}"""
+# The concise prompt is fully static up to the document. It names categories by
+# number (short names, no exact label text) and the reply's label_index is
+# mapped back to the label here
+_CONCISE_CATEGORIES = """CATEGORIES:
+1. Email - Has From:/To:/Subject: headers, email addresses, conversational tone
+2. Claim Notification / Notice of Loss - Formal claim/loss notification with claim numbers, incident details, ACORD forms
+3. Notice of Claim / Complaint - Legal notice, complaint, or acknowledgement letter about a claim
+4. Court / Legal Document - Court filings with case numbers, legal citations, formal legal language (plaintiff, defendant, motion, order)
+5. Medical Document - Medical records with diagnoses, treatments, patient info, clinical terminology
+6. Police / Accident Report - Official police/accident report with report number, officer info, incident details
+7. Bordereau - Tabular listing of multiple insurance risks/claims with policy numbers and premiums in rows
+8. Policy Schedule / Endorsement - Insurance policy showing coverage details, limits, terms, endorsements
+9. Claimant List - List/table of multiple claimants with names and claim amounts
+10. Adjuster Report - Claim investigation report by adjuster with findings and recommendations
+11. Interim Invoice - Billing statement with invoice number, line items, amounts due
+12. Other - Doesn't fit above categories (use rarely)
+"""
+
+_CONCISE_INSTRUCTIONS = """INSTRUCTIONS:
+- Identify key structural markers (email headers, tables, forms, legal format)
+- Match vocabulary and purpose to categories above
+- Choose BEST fit category and answer with its number
+- Other (12) only if truly no match (<5% of cases)
+"""
+
+_CONCISE_PROMPT_HEAD = """Classify this document into ONE category. Output ONLY valid JSON.
+
+""" + _CONCISE_CATEGORIES + "\n" + _CONCISE_INSTRUCTIONS + """
+OUTPUT FORMAT (valid JSON only):
+{
+    "thinking": "Brief analysis of key features observed",
+    "label_index": 1,
+    "score": 0.95
+}
+
+DOCUMENT:
+"""
+
+_INDEX_TO_LABEL = dict(enumerate(DOCUMENT_LABELS_LEGACY_UPDATED, 1))
+
+
+def _index_label(label_index) -> Optional[str]:
+    """Label for a reply's label_index (int or numeric string), None if out of range or invalid."""
+    try:
+        return _INDEX_TO_LABEL.get(int(label_index))
+    except (TypeError, ValueError):
+        return None
+
+
+def _label_from_index(result: dict) -> dict:
+    """Copy of a concise reply with label_index replaced by its label; invalid -> Other, 0.0."""
+    result = dict(result)
+    if 'label_index' not in result and result.get('label') in DOCUMENT_LABELS_LEGACY_UPDATED:
+        return result
     
-    # Prepare the API call data
-    classification_json_data = {
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": classification_prompt}
-                ]
-            }
-        ],
-        "response_format": {"type": "json_object"}
+    label = _index_label(result.pop('label_index', None))
+    if label is None:
+        return {**result, "label": "Other", "score": 0.0}
+    result['label'] = label
+    return result
+
+
+# Several documents in one request, each answered by its index
+_BATCH_PROMPT_HEAD = """Classify EACH of the documents below into ONE category. Output ONLY valid JSON.
+
+""" + _CONCISE_CATEGORIES + "\n" + _CONCISE_INSTRUCTIONS + """- Classify every document independently, one entry per document
+
+OUTPUT FORMAT (valid JSON only):
+{
+    "classifications": [
+        {"idx": 0, "thinking": "Brief analysis of key features observed", "label_index": 1, "score": 0.95}
+    ]
+}
+
+DOCUMENTS:"""
+_BATCH_DOCUMENT_SEPARATOR = "\n---DOC {idx}---\n"
+
+
+# Long documents are cut down before classification: the head and tail are kept,
+# plus any lines from the middle that carry category markers
+_CLASSIFICATION_MARKER_RE = re.compile(
+    r"(?i)(claim\s*(no|number|#)|policy\s*(no|number|#)|from:|to:|subject:|plaintiff|diagnosis|invoice|bordereau|adjuster)"
+)
+_TRUNCATION_MARK = "\n...[TRUNCATED]...\n"
+
+
+def _prepare_document_for_classification(text: str, head_chars: int = 4000, tail_chars: int = 2000,
+                                         max_chars: int = 16000) -> str:
+    """
+    Limit a document to about max_chars for the classification prompt.
+    
+    Documents within the limit are returned unchanged. Longer ones keep the
+    first head_chars and last tail_chars characters, and as many marker lines
+    from the middle as fit in the rest of the budget.
+    """
+    if len(text) <= max_chars:
+        return text
+    
+    budget = max_chars - head_chars - tail_chars
+    marker_lines = []
+    for line in text[head_chars:-tail_chars].splitlines():
+        if _CLASSIFICATION_MARKER_RE.search(line):
+            line = line.strip()
+            if len(line) + 1 > budget:
+                break
+            marker_lines.append(line)
+            budget -= len(line) + 1
+    
+    middle = _TRUNCATION_MARK + "\n".join(marker_lines) if marker_lines else ""
+    return text[:head_chars] + middle + _TRUNCATION_MARK + text[-tail_chars:]
+
+
+def _marker_pattern(marker: str) -> re.Pattern:
+    """Case-insensitive whole-phrase pattern; header markers ("From:") must start a line."""
+    if marker.endswith(':'):
+        return re.compile(r'^\s*' + re.escape(marker[:-1]) + r'\s*:', re.I | re.M)
+    return re.compile(r'(?<!\w)' + re.escape(marker) + r'(?!\w)', re.I)
+
+
+# Local fast path: the key markers of each category that are literal text
+# (descriptive ones, with parentheses or over three words, are left out)
+_FAST_PATH_MARKERS = {
+    label: [
+        _marker_pattern(marker) for marker in desc['key_markers']
+        if '(' not in marker and len(marker.split()) <= 3
+    ]
+    for label, desc in _LABEL_DESCRIPTIONS.items()
+    if label != "Other"
+}
+_FAST_PATH_MIN_MATCHES = 3
+
+
+def fast_classify(content: str) -> Optional[Tuple[str, float]]:
+    """
+    Classify obvious documents locally from their key markers.
+    
+    Returns (label, score) when one category matches at least 3 distinct
+    markers and at least twice as many as any other category, else None.
+    """
+    content = _prepare_document_for_classification(content)
+    counts = sorted(
+        ((sum(1 for pattern in patterns if pattern.search(content)), label)
+         for label, patterns in _FAST_PATH_MARKERS.items()),
+        reverse=True
+    )
+    (best, label), (runner_up, _) = counts[0], counts[1]
+    if best >= _FAST_PATH_MIN_MATCHES and best >= 2 * runner_up:
+        return label, min(0.95, best / 5)
+    return None
+
+
+# Three or more header lines near the top make a document an Email outright
+_EMAIL_HEADER_RE = re.compile(r"^\s*(from|to|subject|sent|cc|bcc)\s*:\s*\S", re.I | re.M)
+_EMAIL_HEADER_WINDOW = 2000
+_EMAIL_HEADER_MIN_HITS = 3
+
+
+def _classify_email_headers(content: str) -> Optional[dict]:
+    """Email classification result if the document opens with email headers, else None."""
+    header_hits = len(_EMAIL_HEADER_RE.findall(content[:_EMAIL_HEADER_WINDOW]))
+    if header_hits < _EMAIL_HEADER_MIN_HITS:
+        return None
+    return {
+        "label": "Email",
+        "score": 0.98,
+        "thinking": f"{header_hits} email header lines detected by local regex"
     }
+
+
+# Every request is one user message and asks for a JSON object back
+_JSON_RESPONSE_FORMAT = {"response_format": {"type": "json_object"}}
+_PROMPT_CACHE_CONTROL = os.getenv("PROMPT_CACHE_CONTROL") == "1"
+
+
+def _wrap_prompt(static_prefix: str, variable_text: str) -> dict:
+    """
+    Request body for a single-message prompt: the static instructions, then the
+    per-call text (document, keys) as a separate content part.
     
-    # Note: Replace with your actual SecureGPT implementation
-    # This is placeholder for the actual API call structure from your code
-    try:
-        # Assuming you have gpt.request function as shown in screenshot
-        # gpt_classification_response = gpt.request(
-        #     json_data=classification_json_data, 
-        #     url=gpt.chat_completions_url
-        # )
-        
-        # For now, return structure - replace with actual API call
-        # gpt_classification_result = gpt_classification_response['choices'][0]['message']['content']
+    Keeping the identical static text first lets OpenAI's automatic prompt cache
+    reuse it across calls. With PROMPT_CACHE_CONTROL=1 the static part also gets
+    an ephemeral cache_control marker, for Anthropic-compatible endpoints.
+    """
+    static_part = {"type": "text", "text": static_prefix}
+    if _PROMPT_CACHE_CONTROL:
+        static_part["cache_control"] = {"type": "ephemeral"}
+    
+    return {
+        "messages": [{"role": "user", "content": [static_part, {"type": "text", "text": variable_text}]}],
+        **_JSON_RESPONSE_FORMAT
+    }
+
+
+# Concurrent requests allowed by the async batch helpers (per event loop)
+_GPT_CONCURRENCY = int(os.getenv("GPT_CONCURRENCY", "16"))
+_semaphores = weakref.WeakKeyDictionary()
+
+# Classifications currently being fetched, per event loop: a document requested
+# again while its first request is pending waits for that request instead
+_inflight_classifications = weakref.WeakKeyDictionary()
+
+# Transient HTTP statuses worth retrying, and how often
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+_MAX_ATTEMPTS = 5
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status carried by a client error, if any (httpx/requests/openai style)."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def _is_retriable(error: BaseException) -> bool:
+    """Timeouts, connection failures, rate limits and 5xx responses."""
+    return (isinstance(error, (httpx.TimeoutException, httpx.NetworkError, TimeoutError, ConnectionError))
+            or _status_code(error) in _RETRY_STATUS_CODES)
+
+
+@retry(
+    retry=retry_if_exception(_is_retriable),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    stop=stop_after_attempt(_MAX_ATTEMPTS),
+    before_sleep=before_sleep_log(logger, logging.WARNING),
+    reraise=True
+)
+def _request_completion(json_data: dict, gpt_client) -> dict:
+    """gpt_client.request, retried on transient failures with jittered exponential backoff."""
+    return gpt_client.request(
+        json_data=json_data,
+        url=gpt_client.chat_completions_url
+    )
+
+
+def _post(json_data: dict, gpt_client) -> dict:
+    """
+    Send a chat request through the SecureGPT client and parse the JSON reply.
+    
+    Transient failures are retried (up to 5 attempts, backoff from 1s to 30s with
+    jitter); other errors, and the last transient one, are raised to the caller.
+    """
+    gpt_response = _request_completion(json_data, gpt_client)
+    gpt_result = gpt_response['choices'][0]['message']['content']
+    return _json_loads(gpt_result)
+
+
+# One keep-alive connection pool shared by every PooledGPTClient, so requests
+# reuse connections instead of a TCP/TLS handshake each (HTTP/2 if h2 is installed)
+_http_session: Optional[httpx.Client] = None
+_http_session_lock = threading.Lock()
+
+
+def _get_http_session() -> httpx.Client:
+    """The shared httpx.Client, created on first use and closed at exit."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = httpx.Client(
+                http2=importlib.util.find_spec('h2') is not None,
+                timeout=httpx.Timeout(connect=5, read=120, write=30, pool=5),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+            atexit.register(_http_session.close)
+        return _http_session
+
+
+class PooledGPTClient:
+    """
+    Minimal OpenAI-compatible client with the SecureGPT interface
+    (.request(json_data=..., url=...) and .chat_completions_url).
+    
+    Requests go through the shared connection pool; the API key and base URL
+    default to OPENAI_API_KEY and OPENAI_BASE_URL from the environment.
+    """
+    
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, model: str = "gpt-4o"):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        base_url = base_url or os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+        self.chat_completions_url = base_url.rstrip('/') + '/chat/completions'
+        self.model = model
+    
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+    
+    def request(self, json_data: dict, url: str) -> dict:
+        """POST json_data (with the default model if none is set); raises on HTTP errors."""
+        response = _get_http_session().post(
+            url,
+            content=_json_dumps({"model": self.model, **json_data}),
+            headers=self._headers()
+        )
+        response.raise_for_status()
+        return _json_loads(response.content)
+    
+    def stream_request(self, json_data: dict, url: str) -> Iterator[str]:
+        """
+        Stream the completion text of json_data as it is generated.
         
-        # Parse and return
-        # import json
-        # classification_dict = json.loads(gpt_classification_result)
-        # return classification_dict
+        Closing the generator early (e.g. breaking out of the loop) closes the
+        response, so the rest of the completion isn't read.
+        """
+        with _get_http_session().stream(
+            "POST",
+            url,
+            content=_json_dumps({"model": self.model, **json_data, "stream": True}),
+            headers=self._headers()
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith('data: '):
+                    continue
+                data = line[len('data: '):]
+                if data == '[DONE]':
+                    break
+                choices = _json_loads(data).get('choices') or [{}]
+                delta = choices[0].get('delta', {}).get('content')
+                if delta:
+                    yield delta
+
+
+# Classification results by request hash. The hash covers the whole request
+# (prompt variant, label list and document) and the client's model and endpoint,
+# so changing a prompt or deployment invalidates its entries. Kept in memory
+# and, for a week, in .classification_cache/
+_CLASSIFICATION_CACHE_DIR = Path('.classification_cache')
+_CLASSIFICATION_CACHE_TTL = 7 * 24 * 3600  # seconds
+_CLASSIFICATION_CACHE_SIZE = 4096
+_classification_cache = {}
+_cache_stats = {'hits': 0, 'misses': 0}
+_cache_lock = threading.Lock()
+
+
+def _classification_cache_key(json_data: dict, gpt_client) -> str:
+    """Hash of the request body plus the client's model and endpoint; key order doesn't change it."""
+    payload = {
+        "model": getattr(gpt_client, 'model', None),
+        "url": gpt_client.chat_completions_url,
+        "request": json_data
+    }
+    return hashlib.sha256(_json_dumps(payload, sort_keys=True)).hexdigest()
+
+
+def _remember_classification(cache_key: str, result: dict):
+    """Keep a result in memory, evicting the oldest entry when full."""
+    with _cache_lock:
+        if len(_classification_cache) >= _CLASSIFICATION_CACHE_SIZE:
+            _classification_cache.pop(next(iter(_classification_cache)))
+        _classification_cache[cache_key] = result
+
+
+def _load_cached_classification(cache_key: str) -> Optional[dict]:
+    """Cached result from memory or an unexpired disk entry (a copy), else None."""
+    result = _classification_cache.get(cache_key)
+    if result is None:
+        cache_path = _CLASSIFICATION_CACHE_DIR / f'{cache_key}.json'
+        try:
+            if time.time() - cache_path.stat().st_mtime < _CLASSIFICATION_CACHE_TTL:
+                result = _json_loads(cache_path.read_bytes())
+                _remember_classification(cache_key, result)
+        except (OSError, ValueError):
+            pass
+    
+    with _cache_lock:
+        _cache_stats['hits' if result is not None else 'misses'] += 1
+    return dict(result) if result is not None else None
+
+
+def _store_cached_classification(cache_key: str, result: dict):
+    """Cache a result in memory and on disk (disk errors are ignored)."""
+    _remember_classification(cache_key, dict(result))
+    try:
+        _CLASSIFICATION_CACHE_DIR.mkdir(exist_ok=True)
+        (_CLASSIFICATION_CACHE_DIR / f'{cache_key}.json').write_bytes(_json_dumps(result))
+    except OSError:
+        pass
+
+
+def _classify_cached(json_data: dict, gpt_client) -> dict:
+    """_post for a classification request, answered from the cache when seen before."""
+    cache_key = _classification_cache_key(json_data, gpt_client)
+    result = _load_cached_classification(cache_key)
+    if result is None:
+        result = _post(json_data, gpt_client)
+        _store_cached_classification(cache_key, result)
+    return result
+
+
+def get_cache_stats() -> dict:
+    """Classification cache hits, misses and in-memory size since import."""
+    with _cache_lock:
+        return {**_cache_stats, 'size': len(_classification_cache)}
+
+
+def classify_document_with_gpt_improved(document_content: str, gpt_client=None) -> dict:
+    """
+    Enhanced document classification using GPT with improved prompting strategy.
+    
+    This function uses a more detailed prompt with:
+    - Clear structural markers and formatting cues
+    - Enhanced class descriptions with key identifiers
+    - Better reasoning guidance
+    - Multi-stage classification approach
+    
+    Args:
+        document_content: The extracted text content from Azure Document Intelligence
+        gpt_client: Your SecureGPT client object (with .request() method); without
+            one, the prompt and request body are returned instead of calling the API
         
+    Returns:
+        dict: Classification result with label, score, and thinking process
+        (clear-cut documents are classified locally by fast_classify, and repeat
+        requests for the same document are served from the cache)
+    """
+    
+    document_content = _prepare_document_for_classification(document_content)
+    classification_prompt = _CLASSIFICATION_PROMPT_HEAD + _CLASSIFICATION_PROMPT_TAIL + document_content
+    
+    classification_json_data = _wrap_prompt(_CLASSIFICATION_PROMPT_HEAD + _CLASSIFICATION_PROMPT_TAIL, document_content)
+    
+    if gpt_client is None:
         return {
             "prompt": classification_prompt,
             "json_data": classification_json_data,
             "note": "Replace with actual gpt.request() call"
         }
+    
+    # Clear-cut documents don't need the model
+    email_result = _classify_email_headers(document_content)
+    if email_result is not None:
+        return email_result
+    
+    fast_result = fast_classify(document_content)
+    if fast_result is not None:
+        label, score = fast_result
+        return {
+            "label": label,
+            "score": score,
+            "thinking": "Classified locally: key markers clearly match this category"
+        }
+    
+    try:
+        return _classify_cached(classification_json_data, gpt_client)
         
     except Exception as e:
-        print(f"Error in classification: {e}")
+        logger.exception("Error in classification")
         return {
             "error": str(e),
             "label": "Other",
@@ -221,99 +671,63 @@ DOCUMENT CONTENT:
 
 
 # Alternative simplified version with more focused prompt
-def classify_document_with_gpt_concise(document_content: str) -> dict:
+def classify_document_with_gpt_concise(document_content: str, gpt_client=None) -> dict:
     """
     Concise version focusing on discriminative features only.
     Sometimes less is more - this version may perform better by reducing prompt complexity.
+    
+    The model answers with a category number (label_index), which is mapped
+    to the exact label here, so the label texts needn't be in the prompt.
+    gpt_client works as in classify_document_with_gpt_improved.
     """
     
-    classification_prompt = f"""Classify this document into ONE category. Output ONLY valid JSON.
-
-CATEGORIES (use exact label text):
-1. "Email" - Has From:/To:/Subject: headers, email addresses, conversational tone
-2. "Claim Notification / Acord / Notice of Loss / Loss Report / Incident Report" - Formal claim/loss notification with claim numbers, incident details, ACORD forms
-3. "Notice of Claim / Complaint / Claim Letter / Acknowledgement" - Legal notice, complaint, or acknowledgement letter about a claim
-4. "Court Document / Legal Document" - Court filings with case numbers, legal citations, formal legal language (plaintiff, defendant, motion, order)
-5. "Medical Document" - Medical records with diagnoses, treatments, patient info, clinical terminology
-6. "Police Report / Accident Report" - Official police/accident report with report number, officer info, incident details
-7. "Bordereau" - Tabular listing of multiple insurance risks/claims with policy numbers and premiums in rows
-8. "Policy Schedule / Slip / Endorsement / Binder / Certificate" - Insurance policy showing coverage details, limits, terms, endorsements
-9. "Claimant List" - List/table of multiple claimants with names and claim amounts
-10. "Adjuster Report" - Claim investigation report by adjuster with findings and recommendations
-11. "Interim Invoice" - Billing statement with invoice number, line items, amounts due
-12. "Other" - Doesn't fit above categories (use rarely)
-
-INSTRUCTIONS:
-- Identify key structural markers (email headers, tables, forms, legal format)
-- Match vocabulary and purpose to categories above
-- Choose BEST fit category using EXACT label text
-- "Other" only if truly no match (<5% of cases)
-
-OUTPUT FORMAT (valid JSON only):
-{{
-    "thinking": "Brief analysis of key features observed",
-    "label": "Exact category label from list",
-    "score": 0.95
-}}
-
-DOCUMENT:
-{document_content}"""
+    document_content = _prepare_document_for_classification(document_content)
+    classification_prompt = _CONCISE_PROMPT_HEAD + document_content
     
-    classification_json_data = {
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": classification_prompt}
-                ]
-            }
-        ],
-        "response_format": {"type": "json_object"}
-    }
+    classification_json_data = _wrap_prompt(_CONCISE_PROMPT_HEAD, document_content)
     
-    return {
-        "prompt": classification_prompt,
-        "json_data": classification_json_data,
-        "note": "Replace with actual gpt.request() call"
-    }
-
-
-def extract_key_values_with_gpt(document_content: str, keys_to_extract: list[str]) -> dict:
-    """
-    Extract specific key-value pairs from document content using GPT.
+    if gpt_client is None:
+        return {
+            "prompt": classification_prompt,
+            "json_data": classification_json_data,
+            "note": "Replace with actual gpt.request() call"
+        }
     
-    This function precisely extracts requested keys from unstructured document text.
-    Designed for high accuracy (90%+ target) through careful prompting.
+    email_result = _classify_email_headers(document_content)
+    if email_result is not None:
+        return email_result
     
-    Args:
-        document_content: The extracted text content from Azure Document Intelligence
-        keys_to_extract: List of key names to extract (e.g., ["claim_number", "loss_date", "claimant_name"])
+    try:
+        return _label_from_index(_classify_cached(classification_json_data, gpt_client))
         
-    Returns:
-        dict: Extracted key-value pairs with metadata
-            {
-                "extracted_data": {
-                    "key1": "value1",
-                    "key2": "value2",
-                    ...
-                },
-                "confidence_scores": {
-                    "key1": 0.95,
-                    "key2": 0.80,
-                    ...
-                },
-                "extraction_notes": {
-                    "key1": "Found in section X",
-                    "key2": "Not found in document",
-                    ...
-                }
-            }
+    except Exception as e:
+        logger.exception("Error in classification")
+        return {
+            "error": str(e),
+            "label": "Other",
+            "score": 0.0
+        }
+
+
+# Documents shorter than this go to the concise classifier
+_DETAILED_MIN_CHARS = int(os.getenv("CLASSIFY_DETAILED_MIN_CHARS", "3000"))
+
+
+def classify_document_auto(document_content: str, gpt_client=None) -> dict:
     """
+    Classify with the concise prompt for short documents and the detailed one
+    for long documents (CLASSIFY_DETAILED_MIN_CHARS, default 3000 characters).
+    """
+    if len(document_content) < _DETAILED_MIN_CHARS:
+        logger.info("Classifying %d-char document with the concise prompt", len(document_content))
+        return classify_document_with_gpt_concise(document_content, gpt_client)
     
-    # Build key descriptions dynamically
-    keys_list_formatted = "\n".join([f'   - "{key}"' for key in keys_to_extract])
-    
-    extraction_prompt = f"""You are a precise data extraction specialist. Your task is to extract SPECIFIC key-value pairs from the provided document.
+    logger.info("Classifying %d-char document with the detailed prompt", len(document_content))
+    return classify_document_with_gpt_improved(document_content, gpt_client)
+
+
+# Extraction instructions; the keys and the document follow them in each request
+_EXTRACTION_INSTRUCTIONS = """You are a precise data extraction specialist. Your task is to extract SPECIFIC key-value pairs from the provided document.
 
 EXTRACTION REQUIREMENTS:
 1. Extract ONLY the exact keys requested - no additional keys
@@ -325,9 +739,6 @@ EXTRACTION REQUIREMENTS:
 7. For amounts/numbers, include currency symbols and formatting as written
 8. Be extremely precise - accuracy is critical
 
-KEYS TO EXTRACT:
-{keys_list_formatted}
-
 EXTRACTION GUIDELINES BY KEY TYPE:
 
 For dates (e.g., "loss_date", "incident_date", "policy_effective_date"):
@@ -372,23 +783,23 @@ EXTRACTION PROCESS:
 5. If key not found after thorough search, mark as null
 
 OUTPUT FORMAT (valid JSON only):
-{{
-    "extracted_data": {{
+{
+    "extracted_data": {
         "key1": "extracted value or null",
         "key2": "extracted value or null",
         ...
-    }},
-    "confidence_scores": {{
+    },
+    "confidence_scores": {
         "key1": 0.95,
         "key2": 0.0,
         ...
-    }},
-    "extraction_notes": {{
+    },
+    "extraction_notes": {
         "key1": "Found after 'Claim Number:' label in header section",
         "key2": "Not found in document",
         ...
-    }}
-}}
+    }
+}
 
 CONFIDENCE SCORING:
 - 1.0: Value found with clear label/context, exact match certain
@@ -405,50 +816,78 @@ CRITICAL RULES:
 - Preserve original formatting and wording from document
 - Focus on precision over recall - better to return null than wrong value
 
-DOCUMENT CONTENT:
-{document_content}"""
+"""
+
+
+@lru_cache(maxsize=256)
+def _keys_list_formatted(keys_to_extract: Tuple[str, ...]) -> str:
+    """Bulleted key list for a schema, built once per key list."""
+    return "\n".join(f'   - "{key}"' for key in keys_to_extract)
+
+
+def extract_key_values_with_gpt(document_content: str, keys_to_extract: list[str], gpt_client=None) -> dict:
+    """
+    Extract specific key-value pairs from document content using GPT.
     
-    extraction_json_data = {
-        "messages": [
+    This function precisely extracts requested keys from unstructured document text.
+    Designed for high accuracy (90%+ target) through careful prompting.
+    
+    Args:
+        document_content: The extracted text content from Azure Document Intelligence
+        keys_to_extract: List of key names to extract (e.g., ["claim_number", "loss_date", "claimant_name"])
+        gpt_client: Your SecureGPT client object (with .request() method); without
+            one, the prompt and request body are returned instead of calling the API
+        
+    Returns:
+        dict: Extracted key-value pairs with metadata
             {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": extraction_prompt}
-                ]
+                "extracted_data": {
+                    "key1": "value1",
+                    "key2": "value2",
+                    ...
+                },
+                "confidence_scores": {
+                    "key1": 0.95,
+                    "key2": 0.80,
+                    ...
+                },
+                "extraction_notes": {
+                    "key1": "Found in section X",
+                    "key2": "Not found in document",
+                    ...
+                }
             }
-        ],
-        "response_format": {"type": "json_object"}
-    }
+    """
     
-    try:
-        # Placeholder for actual API call
-        # Replace with your SecureGPT implementation:
-        # gpt_extraction_response = gpt.request(
-        #     json_data=extraction_json_data,
-        #     url=gpt.chat_completions_url
-        # )
-        # gpt_extraction_result = gpt_extraction_response['choices'][0]['message']['content']
-        # 
-        # import json
-        # extraction_dict = json.loads(gpt_extraction_result)
-        # 
-        # # Validate all requested keys are present
-        # for key in keys_to_extract:
-        #     if key not in extraction_dict.get('extracted_data', {}):
-        #         extraction_dict['extracted_data'][key] = null
-        #         extraction_dict['confidence_scores'][key] = 0.0
-        #         extraction_dict['extraction_notes'][key] = "Key not found in extraction"
-        # 
-        # return extraction_dict
-        
+    extraction_request = (
+        "KEYS TO EXTRACT:\n" + _keys_list_formatted(tuple(keys_to_extract))
+        + "\n\nDOCUMENT CONTENT:\n" + document_content
+    )
+    extraction_prompt = _EXTRACTION_INSTRUCTIONS + extraction_request
+    
+    extraction_json_data = _wrap_prompt(_EXTRACTION_INSTRUCTIONS, extraction_request)
+    
+    if gpt_client is None:
         return {
             "prompt": extraction_prompt,
             "json_data": extraction_json_data,
             "note": "Replace with actual gpt.request() call"
         }
+    
+    try:
+        extraction_dict = _post(extraction_json_data, gpt_client)
+        
+        # Validate all requested keys are present
+        for key in keys_to_extract:
+            if key not in extraction_dict.get('extracted_data', {}):
+                extraction_dict.setdefault('extracted_data', {})[key] = None
+                extraction_dict.setdefault('confidence_scores', {})[key] = 0.0
+                extraction_dict.setdefault('extraction_notes', {})[key] = "Key not found in extraction"
+        
+        return extraction_dict
         
     except Exception as e:
-        print(f"Error in key-value extraction: {e}")
+        logger.exception("Error in key-value extraction")
         # Return structure with nulls for all keys
         return {
             "error": str(e),
@@ -458,6 +897,206 @@ DOCUMENT CONTENT:
         }
 
 
+# ============================================================================
+# STREAMING CLASSIFICATION
+# ============================================================================
+
+# "label" (or "label_index") and "score" fields once they are complete in a partial JSON reply
+_STREAM_LABEL_RE = re.compile(r'"label"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_STREAM_LABEL_INDEX_RE = re.compile(r'"label_index"\s*:\s*"?(\d+)"?\s*[,}]')
+_STREAM_SCORE_RE = re.compile(r'"score"\s*:\s*"?(\d+(?:\.\d+)?)"?\s*[,}]')
+
+
+def stream_classify_document(document_content: str, gpt_client: PooledGPTClient, concise: bool = True,
+                             min_score: float = 0.95) -> dict:
+    """
+    Classify with a streamed reply, stopping as soon as the result is settled.
+    
+    Once the reply contains a valid label and a score above min_score the
+    stream is closed and the result returned, with whatever reasoning had
+    arrived as 'thinking'. Otherwise the full reply is parsed as usual.
+    The gain depends on where the model puts label and score: the prompts
+    ask for thinking first, so for them this mostly saves the tail.
+    """
+    classify = classify_document_with_gpt_concise if concise else classify_document_with_gpt_improved
+    json_data = classify(document_content)['json_data']
+    
+    buffer = ""
+    try:
+        for delta in gpt_client.stream_request(json_data, gpt_client.chat_completions_url):
+            buffer += delta
+            index_match = _STREAM_LABEL_INDEX_RE.search(buffer)
+            label_match = _STREAM_LABEL_RE.search(buffer)
+            if index_match:
+                label = _index_label(index_match.group(1))
+            else:
+                label = label_match.group(1) if label_match else None
+            score_match = _STREAM_SCORE_RE.search(buffer)
+            if label in DOCUMENT_LABELS_LEGACY_UPDATED and score_match and float(score_match.group(1)) > min_score:
+                thinking = re.search(r'"thinking"\s*:\s*"((?:[^"\\]|\\.)*)', buffer)
+                return {
+                    "label": label,
+                    "score": float(score_match.group(1)),
+                    "thinking": thinking.group(1) if thinking else ""
+                }
+        result = _json_loads(buffer)
+        return _label_from_index(result) if concise else result
+        
+    except Exception as e:
+        logger.exception("Error in classification")
+        return {
+            "error": str(e),
+            "label": "Other",
+            "score": 0.0
+        }
+
+
+# ============================================================================
+# CONCURRENT (ASYNC) VARIANTS
+# ============================================================================
+
+def _concurrency_limit() -> asyncio.Semaphore:
+    """Semaphore capping in-flight requests on the running event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(_GPT_CONCURRENCY)
+    return _semaphores[loop]
+
+
+async def aclassify_document(document_content: str, gpt_client, concise: bool = True) -> dict:
+    """
+    classify_document_with_gpt_concise (or _improved) without blocking the event loop.
+    
+    The SecureGPT client is synchronous, so the request runs in a worker thread;
+    at most GPT_CONCURRENCY (env, default 16) requests are in flight at once, and
+    concurrent calls for the same document share one request.
+    """
+    classify = classify_document_with_gpt_concise if concise else classify_document_with_gpt_improved
+    inflight = _inflight_classifications.setdefault(asyncio.get_running_loop(), {})
+    key = (concise, id(gpt_client), hashlib.sha256(document_content.encode('utf-8')).hexdigest())
+    
+    # The request runs as its own task, so cancelling one caller (even the one
+    # that started it) leaves the others waiting on the shared result
+    request = inflight.get(key)
+    if request is None:
+        request = inflight[key] = asyncio.ensure_future(_classify_limited(classify, document_content, gpt_client))
+        request.add_done_callback(lambda done: _finish_inflight(inflight, key, done))
+    return dict(await asyncio.shield(request))
+
+
+async def _classify_limited(classify, document_content: str, gpt_client) -> dict:
+    """Run a synchronous classify function in a worker thread, within the concurrency limit."""
+    async with _concurrency_limit():
+        return await asyncio.to_thread(classify, document_content, gpt_client)
+
+
+def _finish_inflight(inflight: dict, key: tuple, request: asyncio.Future):
+    """Forget a finished shared request."""
+    del inflight[key]
+    if not request.cancelled():
+        request.exception()  # callers get it; don't warn if they were all cancelled
+
+
+async def aextract_key_values(document_content: str, keys_to_extract: List[str], gpt_client) -> dict:
+    """extract_key_values_with_gpt without blocking the event loop (see aclassify_document)."""
+    async with _concurrency_limit():
+        return await asyncio.to_thread(extract_key_values_with_gpt, document_content, keys_to_extract, gpt_client)
+
+
+async def classify_documents_batch(docs: List[str], gpt_client, concise: bool = True) -> List[dict]:
+    """Classify documents concurrently; results are in the order of docs."""
+    return await asyncio.gather(*[aclassify_document(doc, gpt_client, concise) for doc in docs])
+
+
+async def aextract_key_values_parallel(document_content: str, keys_to_extract: List[str], gpt_client,
+                                      group_size: int = 3) -> dict:
+    """
+    Extract keys in groups of group_size, one concurrent request per group.
+    
+    Each request only has to find a few keys, which helps on long documents,
+    at the cost of sending the document once per group. The groups' results
+    are merged; if any group failed, 'error' lists the failures.
+    """
+    groups = [keys_to_extract[start:start + group_size] for start in range(0, len(keys_to_extract), group_size)]
+    group_results = await asyncio.gather(
+        *[aextract_key_values(document_content, group, gpt_client) for group in groups]
+    )
+    
+    merged = {"extracted_data": {}, "confidence_scores": {}, "extraction_notes": {}}
+    errors = []
+    for result in group_results:
+        for section in merged:
+            merged[section].update(result.get(section, {}))
+        if result.get('error'):
+            errors.append(str(result['error']))
+    
+    if errors:
+        merged['error'] = "; ".join(errors)
+    return merged
+
+
+async def extract_key_values_batch(docs: List[str], keys_to_extract: List[str], gpt_client) -> List[dict]:
+    """Extract the same keys from several documents concurrently, in the order of docs."""
+    return await asyncio.gather(*[aextract_key_values(doc, keys_to_extract, gpt_client) for doc in docs])
+
+
+def batch_classification_json_data(docs: List[str]) -> dict:
+    """Request body classifying all of docs in a single call (concise categories)."""
+    documents = "".join(
+        _BATCH_DOCUMENT_SEPARATOR.format(idx=idx) + _prepare_document_for_classification(doc)
+        for idx, doc in enumerate(docs)
+    )
+    
+    return _wrap_prompt(_BATCH_PROMPT_HEAD, documents)
+
+
+def _parse_batch_classifications(response: dict, count: int) -> List[Optional[dict]]:
+    """Results in document order; None where the entry is missing or has an invalid label_index."""
+    results = [None] * count
+    entries = response.get('classifications') if isinstance(response, dict) else None
+    for entry in entries if isinstance(entries, list) else []:
+        idx = entry.get('idx') if isinstance(entry, dict) else None
+        label = _index_label(entry.get('label_index')) if isinstance(idx, int) else None
+        if label is not None and 0 <= idx < count:
+            results[idx] = {
+                "thinking": entry.get('thinking', ''),
+                "label": label,
+                "score": entry.get('score', 0.0)
+            }
+    return results
+
+
+async def _aclassify_batch(docs: List[str], gpt_client) -> List[dict]:
+    """One batched request; documents it didn't answer properly are classified singly."""
+    try:
+        async with _concurrency_limit():
+            response = await asyncio.to_thread(_post, batch_classification_json_data(docs), gpt_client)
+        results = _parse_batch_classifications(response, len(docs))
+    except Exception:
+        logger.exception("Error in batch classification; classifying its documents one by one")
+        results = [None] * len(docs)
+    
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if missing:
+        retried = await classify_documents_batch([docs[idx] for idx in missing], gpt_client)
+        for idx, result in zip(missing, retried):
+            results[idx] = result
+    return results
+
+
+async def classify_documents_batched(docs: List[str], gpt_client, batch_size: int = 16) -> List[dict]:
+    """
+    Classify documents batch_size at a time in a single request each.
+    
+    Saves the per-request overhead for many short documents; batches run
+    concurrently and results are in the order of docs. Only suitable when a
+    batch of documents fits comfortably in the model's context.
+    """
+    batches = [docs[start:start + batch_size] for start in range(0, len(docs), batch_size)]
+    batch_results = await asyncio.gather(*[_aclassify_batch(batch, gpt_client) for batch in batches])
+    return [result for results in batch_results for result in results]
+
+
 # Example usage
 if __name__ == "__main__":
     # Example document content
@@ -11,8 +11,17 @@ KEY LOGIC:
 
 import json
 import os
-from typing import Dict, List, Optional, Any
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import product
+from typing import Dict, List, Optional, Any, Tuple
 
+# orjson (optional) parses ground-truth lines straight from bytes, much faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Lower index = HIGHER priority
 DOCUMENT_TYPE_HIERARCHY = [
@@ -22,6 +31,41 @@ DOCUMENT_TYPE_HIERARCHY = [
     "Other"
 ]
 
+# Every case spelling of ".pdf", so names are matched without lowercasing each one
+_PDF_SUFFIXES = tuple('.' + ''.join(chars) for chars in product(*zip('pdf', 'PDF')))
+
+# Label -> priority, so lookups don't scan the list. Keys are interned, as are
+# classifier labels in execute_pipeline_with_attachments
+_PRIORITY: Dict[str, int] = {sys.intern(label): i for i, label in enumerate(DOCUMENT_TYPE_HIERARCHY)}
+_DEFAULT_PRIORITY = len(DOCUMENT_TYPE_HIERARCHY)  # Unknown label = lowest priority
+
+# Conflicting values are listed in extraction_notes ("Also found: ...");
+# MERGE_CONFLICT_NOTES=0 skips building those strings when notes aren't read
+_RECORD_CONFLICT_NOTES = os.getenv("MERGE_CONFLICT_NOTES", "1") != "0"
+
+# Ground-truth files are read in blocks of this size and split on newlines
+_JSONL_READ_CHUNK = 1 << 20
+
+
+def _iter_jsonl_lines(f, chunk_size: int = _JSONL_READ_CHUNK):
+    """
+    Yield (line_num, line_bytes) from a binary file, reading large blocks.
+    Only the trailing partial line of each block is carried over.
+    """
+    line_num = 0
+    carry = b''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        parts = (carry + chunk).split(b'\n')
+        carry = parts.pop()
+        for line in parts:
+            line_num += 1
+            yield line_num, line
+    if carry:
+        yield line_num + 1, carry
+
 
 def load_ground_truth_from_jsonl(jsonl_path: str) -> Dict[str, Dict]:
     """
@@ -39,14 +83,16 @@ def load_ground_truth_from_jsonl(jsonl_path: str) -> Dict[str, Dict]:
     print(f"Loading ground truth from: {jsonl_path}")
     
     try:
-        with open(jsonl_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
+        # Binary mode: both parsers accept UTF-8 bytes, so lines are never decoded to str first
+        loads = orjson.loads if orjson is not None else json.loads
+        with open(jsonl_path, 'rb', buffering=_JSONL_READ_CHUNK) as f:
+            for line_num, line in _iter_jsonl_lines(f):
+                # Parsers tolerate surrounding whitespace; only blank lines are skipped
+                if not line or line.isspace():
                     continue
                     
                 try:
-                    data = json.loads(line)
+                    data = loads(line)
                     file_path = data.get('file_path')
                     
                     if not file_path:
@@ -55,7 +101,7 @@ def load_ground_truth_from_jsonl(jsonl_path: str) -> Dict[str, Dict]:
                     
                     ground_truth[file_path] = data
                     
-                except json.JSONDecodeError as e:
+                except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses it
                     print(f"Error parsing line {line_num}: {e}")
                     continue
         
@@ -70,23 +116,36 @@ def load_ground_truth_from_jsonl(jsonl_path: str) -> Dict[str, Dict]:
         return {}
 
 
+@lru_cache(maxsize=8192)
 def get_attachment_dir(msg_path: str) -> str:
     """
     Get attachment directory for a .msg file.
-    Folder has same name as .msg file (without .msg extension)
+    Folder has same name as .msg file (without .msg extension, any case)
     """
-    msg_dir = os.path.dirname(msg_path)
-    msg_basename = os.path.basename(msg_path)
+    msg_dir, msg_basename = os.path.split(msg_path)
     
-    # Remove .msg extension
-    if msg_basename.endswith('.msg'):
-        folder_name = msg_basename[:-4]
-    else:
+    # Remove .msg extension; other extensions are part of the folder name
+    folder_name, extension = os.path.splitext(msg_basename)
+    if extension.lower() != '.msg':
         folder_name = msg_basename
     
     return os.path.join(msg_dir, folder_name)
 
 
+@lru_cache(maxsize=4096)
+def _pdf_filenames(attachment_dir: str) -> Tuple[str, ...]:
+    """
+    Sorted PDF file names in a directory, keyed by its real path.
+    Cleared at the start of each batch so new files are picked up.
+    """
+    # DirEntry.is_file() answers from the directory listing, without a stat, except for symlinks
+    with os.scandir(attachment_dir) as entries:
+        return tuple(sorted(
+            entry.name for entry in entries
+            if entry.name.endswith(_PDF_SUFFIXES) and entry.is_file()
+        ))
+
+
 def get_pdf_attachments(msg_path: str) -> List[str]:
     """Get list of PDF attachments. Only PDFs are processed."""
     attachment_dir = get_attachment_dir(msg_path)
@@ -95,17 +154,13 @@ def get_pdf_attachments(msg_path: str) -> List[str]:
         print(f"Warning: Attachment directory not found: {attachment_dir}")
         return []
     
-    pdf_files = []
     try:
-        for filename in os.listdir(attachment_dir):
-            if filename.lower().endswith('.pdf'):
-                pdf_path = os.path.join(attachment_dir, filename)
-                pdf_files.append(pdf_path)
-        pdf_files.sort()
+        pdf_names = _pdf_filenames(os.path.realpath(attachment_dir))
     except Exception as e:
         print(f"Error listing attachments: {e}")
+        return []
     
-    return pdf_files
+    return [os.path.join(attachment_dir, filename) for filename in pdf_names]
 
 
 def get_document_hierarchy_priority(doc_label: str) -> int:
@@ -113,10 +168,65 @@ def get_document_hierarchy_priority(doc_label: str) -> int:
     Get hierarchy priority for a document type.
     Lower number = higher priority.
     """
-    try:
-        return DOCUMENT_TYPE_HIERARCHY.index(doc_label)
-    except ValueError:
-        return len(DOCUMENT_TYPE_HIERARCHY)  # Unknown label = lowest priority
+    return _PRIORITY.get(doc_label, _DEFAULT_PRIORITY)
+
+
+def _select_values(
+    columns: List[Dict[str, Any]],
+    priorities: List[int],
+    keys: List[str]
+) -> List[Tuple[List[int], Optional[int]]]:
+    """
+    For each key, return (indices of attachments with a non-null value, winner index).
+    columns holds each attachment's extracted_data. The winner is the highest
+    priority one, ties going to the earlier attachment; it is None when every
+    value is null.
+    """
+    selections = []
+    for key in keys:
+        found = [idx for idx, data in enumerate(columns) if data.get(key) is not None]
+        winner_idx = min(found, key=priorities.__getitem__) if found else None
+        selections.append((found, winner_idx))
+    return selections
+
+
+def _all_null_merge(keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Merge result with every key set to the all-null outcome. Built with
+    dict.fromkeys so each dict is sized for all keys up front; merges then
+    only overwrite the keys that have a value.
+    """
+    return {
+        'extracted_data': dict.fromkeys(keys),
+        'confidence_scores': dict.fromkeys(keys, 0.0),
+        'extraction_notes': dict.fromkeys(keys, 'Not found in any attachment'),
+        'sources': dict.fromkeys(keys),
+        'winning_doc_types': dict.fromkeys(keys)
+    }
+
+
+def _single_attachment_merge(extraction: Dict[str, Any], doc_type: str, keys: List[str]) -> Dict[str, Any]:
+    """
+    merge_extractions_by_hierarchy for one attachment: every non-null value
+    wins by default, so no priorities or selection are needed.
+    """
+    data = extraction['extracted_data']
+    scores = extraction['confidence_scores']
+    source = extraction.get('source', 'attachment_0')
+    found_note = f"Found in {source} ({doc_type})"
+    
+    merged = _all_null_merge(keys)
+    
+    for key in keys:
+        value = data.get(key)
+        if value is not None:
+            merged['extracted_data'][key] = value
+            merged['confidence_scores'][key] = scores.get(key, 0.0)
+            merged['extraction_notes'][key] = found_note
+            merged['sources'][key] = source
+            merged['winning_doc_types'][key] = doc_type
+    
+    return merged
 
 
 def merge_extractions_by_hierarchy(
@@ -144,86 +254,65 @@ def merge_extractions_by_hierarchy(
       Interim Invoice (priority 10): "11-01-1996"
     -> Result: "11-01-1996" (only non-null value, even though from lower priority doc)
     """
-    merged = {
-        'extracted_data': {},
-        'confidence_scores': {},
-        'extraction_notes': {},
-        'sources': {},
-        'winning_doc_types': {}
-    }
+    # Attachments without a classification are ignored, as zip() would
+    extractions = extractions[:len(classifications)]
+    classifications = classifications[:len(extractions)]
     
-    for key in keys:
-        # Collect all non-null values with metadata
-        non_null_values = []
+    if len(extractions) == 1:
+        return _single_attachment_merge(extractions[0], classifications[0], keys)
+    
+    merged = _all_null_merge(keys)
+    
+    # Per-attachment sub-dicts and metadata, looked up once rather than once per key
+    columns = [extraction['extracted_data'] for extraction in extractions]
+    scores = [extraction['confidence_scores'] for extraction in extractions]
+    sources = [extraction.get('source', f'attachment_{idx}') for idx, extraction in enumerate(extractions)]
+    priorities = [get_document_hierarchy_priority(doc_type) for doc_type in classifications]
+    
+    for key, (found, winner_idx) in zip(keys, _select_values(columns, priorities, keys)):
+        if winner_idx is None:
+            continue  # All null: the defaults stand
         
-        for idx, (extraction, doc_type) in enumerate(zip(extractions, classifications)):
-            value = extraction['extracted_data'].get(key)
-            
-            if value is not None:
-                confidence = extraction['confidence_scores'].get(key, 0.0)
-                note = extraction['extraction_notes'].get(key, '')
-                source = extraction.get('source', f'attachment_{idx}')
-                priority = get_document_hierarchy_priority(doc_type)
-                
-                non_null_values.append({
-                    'value': value,
-                    'confidence': confidence,
-                    'note': note,
-                    'source': source,
-                    'doc_type': doc_type,
-                    'priority': priority
-                })
+        value = columns[winner_idx][key]
+        source = sources[winner_idx]
+        winning_doc_type = classifications[winner_idx]
         
-        # Decide which value to use
-        if not non_null_values:
-            # All null
-            merged['extracted_data'][key] = None
-            merged['confidence_scores'][key] = 0.0
-            merged['extraction_notes'][key] = 'Not found in any attachment'
-            merged['sources'][key] = None
-            merged['winning_doc_types'][key] = None
-            
-        elif len(non_null_values) == 1:
-            # Only one non-null value
-            item = non_null_values[0]
-            merged['extracted_data'][key] = item['value']
-            merged['confidence_scores'][key] = item['confidence']
-            merged['extraction_notes'][key] = f"Found in {item['source']} ({item['doc_type']})"
-            merged['sources'][key] = item['source']
-            merged['winning_doc_types'][key] = item['doc_type']
-            
+        if len(found) == 1 or not _RECORD_CONFLICT_NOTES:
+            note = f"Found in {source} ({winning_doc_type})"
         else:
-            # Multiple non-null values - use HIGHEST PRIORITY (lowest priority number)
-            non_null_values.sort(key=lambda x: x['priority'])
-            winner = non_null_values[0]
-            
-            merged['extracted_data'][key] = winner['value']
-            merged['confidence_scores'][key] = winner['confidence']
-            merged['sources'][key] = winner['source']
-            merged['winning_doc_types'][key] = winner['doc_type']
-            
-            # Note other values
+            # Note other values, in attachment order
             other_values_str = ', '.join([
-                f"'{item['value']}' from {item['doc_type']}"
-                for item in non_null_values[1:]
+                f"'{columns[idx][key]}' from {classifications[idx]}"
+                for idx in found
+                if idx != winner_idx
             ])
-            
-            merged['extraction_notes'][key] = (
-                f"Selected '{winner['value']}' from {winner['doc_type']} (highest priority). "
+            note = (
+                f"Selected '{value}' from {winning_doc_type} (highest priority). "
                 f"Also found: {other_values_str}"
             )
+        
+        merged['extracted_data'][key] = value
+        merged['confidence_scores'][key] = scores[winner_idx].get(key, 0.0)
+        merged['extraction_notes'][key] = note
+        merged['sources'][key] = source
+        merged['winning_doc_types'][key] = winning_doc_type
     
     return merged
 
 
 def compare_extracted_with_expected(extracted: Dict[str, Any], expected: Dict[str, Any]) -> Dict:
-    """Compare extracted vs expected values."""
+    """
+    Compare extracted vs expected values.
+    
+    total_extracted counts expected keys with a non-null extracted value;
+    extracted keys that were not expected are ignored.
+    """
     comparison = {
         'matches': 0,
         'mismatches': 0,
         'missing': 0,
         'total_expected': len(expected),
-        'total_extracted': sum(1 for v in extracted.values() if v is not None),
+        'total_extracted': 0,
         'details': {}
     }
     
@@ -237,7 +326,11 @@ def compare_extracted_with_expected(extracted: Dict[str, Any], expected: Dict[st
                 'expected': expected_value,
                 'extracted': None
             }
-        elif str(extracted_value).strip().lower() == str(expected_value).strip().lower():
+        elif (
+            # Identical strings match without building normalized copies
+            (extracted_value == expected_value and type(extracted_value) is str and type(expected_value) is str)
+            or str(extracted_value).strip().lower() == str(expected_value).strip().lower()
+        ):
             comparison['matches'] += 1
             comparison['details'][key] = {
                 'status': 'match',
@@ -252,6 +345,9 @@ def compare_extracted_with_expected(extracted: Dict[str, Any], expected: Dict[st
                 'extracted': extracted_value
             }
     
+    # Every expected key is either missing or has a non-null value
+    comparison['total_extracted'] = comparison['total_expected'] - comparison['missing']
+    
     if comparison['total_expected'] > 0:
         comparison['accuracy'] = (comparison['matches'] / comparison['total_expected']) * 100
     else:
@@ -260,12 +356,39 @@ def compare_extracted_with_expected(extracted: Dict[str, Any], expected: Dict[st
     return comparison
 
 
+def _start_content_extraction(
+    pdf_paths: List[str],
+    doc_intel_function,
+    max_workers: int
+) -> List[Optional[Future]]:
+    """
+    Submit Document Intelligence calls for all attachments to a thread pool.
+    Returns one future per path, or all None when max_workers <= 1 (the
+    caller then extracts each attachment inline).
+    """
+    if max_workers <= 1 or len(pdf_paths) <= 1:
+        return [None] * len(pdf_paths)
+    
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(pdf_paths)))
+    futures = [pool.submit(doc_intel_function, pdf_path, first_n_pages=None) for pdf_path in pdf_paths]
+    pool.shutdown(wait=False)  # Submitted calls still run; workers exit when done
+    return futures
+
+
+def _write_lines(lines: List[str]) -> None:
+    """Write buffered progress lines to stdout in a single call."""
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+
+
 def execute_pipeline_with_attachments(
     idx: int,
     msg_path: str,
     ground_truth_entry: Optional[Dict],
     gpt_client,
-    doc_intel_function
+    doc_intel_function,
+    max_workers: int = 1,
+    verbose: bool = True
 ) -> Dict:
     """
     Process a .msg file with PDF attachments.
@@ -279,10 +402,17 @@ def execute_pipeline_with_attachments(
        - Extract same keys
     4. Merge using hierarchy
     5. Compare with expected
+    
+    With max_workers > 1, content extraction for all attachments runs
+    concurrently; everything else still happens in attachment order.
+    With verbose=False, progress lines are buffered and written to stdout in
+    one call when the file is done, so concurrent files don't interleave.
     """
+    lines: List[str] = []
+    log = print if verbose else lines.append
     
-    print(f"\n{'='*30}")
-    print(f"[{idx}] Processing: {os.path.basename(msg_path)}")
+    log(f"\n{'='*30}")
+    log(f"[{idx}] Processing: {os.path.basename(msg_path)}")
     
     result = {
         'idx': idx,
@@ -300,10 +430,11 @@ def execute_pipeline_with_attachments(
             expected_kvp = ground_truth_entry.get('expected_kvp', {})
             keys_to_extract = list(expected_kvp.keys())
             result['expected_kvp'] = expected_kvp
-            print(f"Keys to extract: {keys_to_extract}")
+            log(f"Keys to extract: {keys_to_extract}")
         
         if not keys_to_extract:
             result['status'] = 'no_keys'
+            _write_lines(lines)
             return result
         
         # Get PDF attachments
@@ -311,9 +442,10 @@ def execute_pipeline_with_attachments(
         
         if not pdf_attachments:
             result['status'] = 'no_attachments'
+            _write_lines(lines)
             return result
         
-        print(f"Found {len(pdf_attachments)} PDF attachments")
+        log(f"Found {len(pdf_attachments)} PDF attachments")
         result['num_attachments'] = len(pdf_attachments)
         
         # Process each attachment
@@ -321,19 +453,24 @@ def execute_pipeline_with_attachments(
         all_classifications = []
         attachment_results = []
         
+        pending_contents = _start_content_extraction(pdf_attachments, doc_intel_function, max_workers)
+        
         for att_idx, pdf_path in enumerate(pdf_attachments):
             att_name = os.path.basename(pdf_path)
-            print(f"\n   [{att_idx+1}/{len(pdf_attachments)}] {att_name}")
+            log(f"\n   [{att_idx+1}/{len(pdf_attachments)}] {att_name}")
             
             try:
                 # Extract content
-                print(f"Extracting content...")
-                adi_results = doc_intel_function(pdf_path, first_n_pages=None)
+                log(f"Extracting content...")
+                if pending_contents[att_idx] is not None:
+                    adi_results = pending_contents[att_idx].result()
+                else:
+                    adi_results = doc_intel_function(pdf_path, first_n_pages=None)
                 document_content = adi_results['content']
-                print(f"Extracted {len(document_content)} chars")
+                log(f"Extracted {len(document_content)} chars")
                 
                 # Classify
-                print(f"Classifying...")
+                log(f"Classifying...")
                 # TODO: REPLACE WITH YOUR ACTUAL FUNCTION
                 # classification = classify_document_with_gpt_concise(document_content, gpt_client)
                 classification = {
@@ -342,12 +479,13 @@ def execute_pipeline_with_attachments(
                     'thinking': 'Placeholder'
                 }
                 
-                doc_type = classification['label']
+                # Interned so hierarchy lookups match the _PRIORITY keys by identity
+                doc_type = sys.intern(classification['label'])
                 all_classifications.append(doc_type)
-                print(f"Classified as: {doc_type}")
+                log(f"Classified as: {doc_type}")
                 
                 # Extract KVP
-                print(f"Extracting {len(keys_to_extract)} keys...")
+                log(f"Extracting {len(keys_to_extract)} keys...")
                 # TODO: REPLACE WITH YOUR ACTUAL FUNCTION
                 # extraction = extract_key_values_with_gpt(document_content, keys_to_extract, gpt_client)
                 
@@ -368,8 +506,9 @@ def execute_pipeline_with_attachments(
                 extraction['source'] = att_name
                 all_extractions.append(extraction)
                 
-                non_null = sum(1 for v in extraction['extracted_data'].values() if v is not None)
-                print(f"Extracted {non_null}/{len(keys_to_extract)} non-null")
+                extracted_values = extraction['extracted_data'].values()
+                non_null = len(extracted_values) - list(extracted_values).count(None)
+                log(f"Extracted {non_null}/{len(keys_to_extract)} non-null")
                 
                 attachment_results.append({
                     'attachment_name': att_name,
@@ -378,7 +517,7 @@ def execute_pipeline_with_attachments(
                 })
                 
             except Exception as e:
-                print(f"ERROR: {e}")
+                log(f"ERROR: {e}")
                 all_classifications.append('Other')
                 all_extractions.append({
                     'extracted_data': {key: None for key in keys_to_extract},
@@ -390,46 +529,49 @@ def execute_pipeline_with_attachments(
         result['attachment_results'] = attachment_results
         
         # Merge using hierarchy
-        print(f"\nMerging using document type hierarchy...")
+        log(f"\nMerging using document type hierarchy...")
         merged = merge_extractions_by_hierarchy(all_extractions, all_classifications, keys_to_extract)
         result['extraction'] = merged
         
         # Show final values
-        print(f"Final merged values:")
+        log(f"Final merged values:")
         for key in keys_to_extract:
             value = merged['extracted_data'][key]
             doc_type = merged['winning_doc_types'][key]
             if value:
-                print(f"{key}: '{value}' (from {doc_type})")
+                log(f"{key}: '{value}' (from {doc_type})")
             else:
-                print(f"{key}: None")
+                log(f"{key}: None")
         
         # Compare
         if expected_kvp:
-            print(f"\nComparing with expected...")
+            log(f"\nComparing with expected...")
             comparison = compare_extracted_with_expected(merged['extracted_data'], expected_kvp)
             result['comparison'] = comparison
             
-            print(f"Matches: {comparison['matches']}/{comparison['total_expected']}")
-            print(f"Mismatches: {comparison['mismatches']}")
-            print(f"Missing: {comparison['missing']}")
-            print(f"Accuracy: {comparison['accuracy']:.1f}%")
+            log(f"Matches: {comparison['matches']}/{comparison['total_expected']}")
+            log(f"Mismatches: {comparison['mismatches']}")
+            log(f"Missing: {comparison['missing']}")
+            log(f"Accuracy: {comparison['accuracy']:.1f}%")
             
             # Show non-matches
             for key, details in comparison['details'].items():
                 if details['status'] != 'match':
-                    print(f"{key}: {details['status']} - expected '{details['expected']}', got '{details['extracted']}'")
+                    log(f"{key}: {details['status']} - expected '{details['expected']}', got '{details['extracted']}'")
         
         result['status'] = 'success'
-        print(f"\n✓ Complete")
+        log(f"\n✓ Complete")
         
     except Exception as e:
-        print(f"\n✗ ERROR: {e}")
+        log(f"\n✗ ERROR: {e}")
         import traceback
+        _write_lines(lines)
+        lines.clear()
         traceback.print_exc()
         result['status'] = 'error'
         result['error'] = str(e)
     
+    _write_lines(lines)
     return result
 
 
@@ -437,10 +579,19 @@ def process_batch_with_jsonl_ground_truth(
     jsonl_path: str,
     gpt_client,
     doc_intel_function,
-    limit: Optional[int] = None
+    limit: Optional[int] = None,
+    max_workers: int = 1,
+    attachment_workers: int = 1
 ) -> List[Dict]:
-    """Process all .msg files in .jsonl ground truth."""
+    """
+    Process all .msg files in .jsonl ground truth.
     
+    max_workers > 1 processes that many files concurrently, each file's
+    progress output written as one block; attachment_workers is passed on to
+    execute_pipeline_with_attachments. Results keep the ground-truth order.
+    """
+    
+    _pdf_filenames.cache_clear()
     ground_truth = load_ground_truth_from_jsonl(jsonl_path)
     
     if not ground_truth:
@@ -454,12 +605,18 @@ def process_batch_with_jsonl_ground_truth(
     print(f"BATCH: {len(files_to_process)} files")
     print(f"{'='*70}")
     
-    results = []
-    for idx, file_path in enumerate(files_to_process):
-        result = execute_pipeline_with_attachments(
-            idx, file_path, ground_truth[file_path], gpt_client, doc_intel_function
+    def process_file(idx: int, file_path: str) -> Dict:
+        return execute_pipeline_with_attachments(
+            idx, file_path, ground_truth[file_path], gpt_client, doc_intel_function,
+            max_workers=attachment_workers, verbose=max_workers <= 1
         )
-        results.append(result)
+    
+    if max_workers > 1:
+        # Files are independent and I/O bound; map() keeps results in input order
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(process_file, range(len(files_to_process)), files_to_process))
+    else:
+        results = [process_file(idx, file_path) for idx, file_path in enumerate(files_to_process)]
     
     # Summary
     print(f"\n{'='*70}")
@@ -484,6 +641,24 @@ def process_batch_with_jsonl_ground_truth(
     return results
 
 
+def dump_results_jsonl(results: List[Dict], output_path: str) -> None:
+    """
+    Write batch results to a .jsonl file, one result per line.
+    Uses orjson when available (bytes written directly), json otherwise.
+    Values neither library can serialize are written as str().
+    """
+    with open(output_path, 'wb') as f:
+        if orjson is not None:
+            option = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            for result in results:
+                f.write(orjson.dumps(result, default=str, option=option))
+        else:
+            for result in results:
+                f.write((json.dumps(result, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+    
+    print(f"Saved {len(results)} results to {output_path}")
+
+
 # Example usage
 if __name__ == "__main__":
     print("="*70)
@@ -4,16 +4,92 @@ PDF Key-Value Extraction using LangExtract
 
 import os
 import json
+import mmap
+import time
+import hashlib
+import threading
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import textwrap
 from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import langextract as lx
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# pypdfium2 (optional) extracts text in native code (PDFium), much faster than
+# PyPDF2, which read_pdf_pages falls back to. PDFium is not thread-safe, even
+# across separate documents, so all calls into it hold PDFIUM_LOCK.
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+PDFIUM_LOCK = threading.Lock()
+
+# orjson (optional) serializes results several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# LangExtract settings; part of the cache key, so changing them re-runs extraction
+EXTRACT_SETTINGS = {
+    "fence_output": True,
+    "use_schema_constraints": False,
+    "extraction_passes": 2,  # Multiple passes for better recall
+    "max_workers": 5,  # Parallel processing
+    "max_char_buffer": 2000  # Optimal chunk size for forms
+}
+
+# Pages with less text than this (blank or scanned) are not sent to the model
+MIN_PAGE_CHARS = 40
+PAGE_BREAK = "\n\n--- Page Break ---\n\n"
+
+# key_values categories, in output order; unknown extraction classes go to other_info
+KEY_VALUE_CATEGORIES = ("personal_info", "employment_info", "financial_info", "account_info", "other_info")
+KNOWN_CATEGORIES = frozenset(KEY_VALUE_CATEGORIES)
+
+# PDFs processed at once; each lx.extract call also runs up to max_workers requests
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "4"))
+
+# Extraction results keyed by a hash of everything that determines them, one
+# JSON file per key, so re-running over the same PDFs skips the LLM calls.
+# Delete the directory to force fresh extractions.
+CACHE_DIR = Path(".langextract_cache")
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
+
+def cache_key(*parts: str) -> str:
+    """SHA-256 of the given strings"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_cached(key: str) -> Optional[Any]:
+    """Return the cached value for a key, or None if missing or expired"""
+    cache_path = CACHE_DIR / f"{key}.json"
+    try:
+        if time.time() - cache_path.stat().st_mtime < CACHE_TTL:
+            return json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def store_cached(key: str, value: Any):
+    """Write a value to the cache (errors are ignored)"""
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        (CACHE_DIR / f"{key}.json").write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+    except OSError:
+        pass
+
 
 class PDFExtractor:
     """Handle PDF processing and key-value extraction using LangExtract"""
@@ -26,6 +102,8 @@ class PDFExtractor:
             model_id: OpenAI model to use (default: gpt-4o)
         """
         self.model_id = model_id
+        # Results of one run share its start time
+        self.run_timestamp = datetime.now().isoformat()
         self.api_key = os.getenv('OPENAI_API_KEY')
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in .env file")
@@ -42,7 +120,19 @@ class PDFExtractor:
         """)
 
         # Provide comprehensive examples for the model
-        self.examples = self._create_examples()
+        self.examples = tuple(self._create_examples())
+
+        # Everything but the text that determines an extraction, hashed once
+        # here instead of re-serializing the examples for every document
+        self._extract_key = cache_key(
+            self.prompt, repr(self.examples), self.model_id,
+            json.dumps(EXTRACT_SETTINGS, sort_keys=True)
+        )
+
+        # Extractions of this run by cache key, so identical documents (e.g.
+        # duplicate PDFs processed concurrently) share a single lx.extract call
+        self._runs: Dict[str, Future] = {}
+        self._runs_lock = threading.Lock()
 
     def _create_examples(self) -> List[lx.data.ExampleData]:
         """Create few-shot examples for the extraction task"""
@@ -94,6 +184,39 @@ class PDFExtractor:
             ),
         ]
 
+    def extract_from_pages(self, pages: List[str], filename: str) -> Dict[str, Any]:
+        """
+        Extract key-value pairs from the text of each page
+
+        Pages with less than MIN_PAGE_CHARS of text (blank or scanned) are
+        skipped, so no tokens are spent on them.
+
+        Args:
+            pages: Text of each page
+            filename: Name of the source file
+
+        Returns:
+            Dictionary containing extraction results
+        """
+        text_pages = [page for page in pages if len(page.strip()) >= MIN_PAGE_CHARS]
+
+        if len(text_pages) < len(pages):
+            print(f"  {filename}: skipping {len(pages) - len(text_pages)}/{len(pages)} pages without text")
+        if len(text_pages) * 2 < len(pages):
+            print(f"  Warning: most pages of {filename} have no text layer; "
+                  f"scanned PDFs are better read with main_multimodal.py")
+
+        if not text_pages:
+            return {
+                "filename": filename,
+                "timestamp": datetime.now().isoformat(),
+                "error": "No pages with text (scanned PDF?)",
+                "key_values": {},
+                "raw_extractions": []
+            }
+
+        return self.extract_from_text(PAGE_BREAK.join(text_pages), filename)
+
     def extract_from_text(self, text: str, filename: str) -> Dict[str, Any]:
         """
         Extract key-value pairs from text
@@ -108,36 +231,18 @@ class PDFExtractor:
         print(f"Processing {filename}...")
 
         try:
-            result = lx.extract(
-                text_or_documents=text,
-                prompt_description=self.prompt,
-                examples=self.examples,
-                model_id=self.model_id,
-                api_key=self.api_key,
-                fence_output=True,
-                use_schema_constraints=False,
-                extraction_passes=2,  # Multiple passes for better recall
-                max_workers=5,  # Parallel processing
-                max_char_buffer=2000  # Optimal chunk size for forms
-            )
+            extractions = self._extract_cached(text)
 
             # Process extractions into key-value format
-            key_values = self._process_extractions(result)
+            key_values = self._process_extractions(extractions)
 
             return {
                 "filename": filename,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": self.run_timestamp,
                 "model": self.model_id,
-                "extractions_count": len(result.extractions) if result.extractions else 0,
+                "extractions_count": len(extractions),
                 "key_values": key_values,
-                "raw_extractions": [
-                    {
-                        "class": e.extraction_class,
-                        "text": e.extraction_text,
-                        "attributes": e.attributes
-                    }
-                    for e in (result.extractions or [])
-                ]
+                "raw_extractions": serialize_extractions(extractions)
             }
 
         except Exception as e:
@@ -150,76 +255,166 @@ class PDFExtractor:
                 "raw_extractions": []
             }
 
-    def _process_extractions(self, result) -> Dict[str, Any]:
+    def _extract_cached(self, text: str) -> List[lx.data.Extraction]:
         """
-        Convert extractions to organized key-value pairs
+        Run lx.extract on text, reusing the result of an identical earlier run
+
+        Identical text seen earlier in this run, even if its extraction is
+        still in progress, gets the same result instead of a second call.
 
         Args:
-            result: LangExtract result object
+            text: Document text to process
 
         Returns:
-            Dictionary of organized key-value pairs by category
+            List of extractions
         """
-        key_values = {
-            "personal_info": {},
-            "employment_info": {},
-            "financial_info": {},
-            "account_info": {},
-            "other_info": {}
-        }
+        key = cache_key(self._extract_key, text)
+        with self._runs_lock:
+            run = self._runs.get(key)
+            first = run is None
+            if first:
+                run = self._runs[key] = Future()
 
-        if not result.extractions:
-            return key_values
+        if not first:
+            print("  Same text as another document in this run, reusing its extraction")
+            return run.result()
 
-        for extraction in result.extractions:
-            category = extraction.extraction_class
+        try:
+            extractions = self._load_or_extract(key, text)
+        except BaseException as e:
+            run.set_exception(e)
+            raise
+        run.set_result(extractions)
+        return extractions
+
+    def _load_or_extract(self, key: str, text: str) -> List[lx.data.Extraction]:
+        """Load the extraction for key from the cache, or run lx.extract and store it"""
+        cached = load_cached(key)
+        if cached is not None:
+            print("  Using cached extraction")
+            return deserialize_extractions(cached)
+
+        result = lx.extract(
+            text_or_documents=text,
+            prompt_description=self.prompt,
+            examples=self.examples,
+            model_id=self.model_id,
+            api_key=self.api_key,
+            **EXTRACT_SETTINGS
+        )
+        extractions = list(result.extractions or [])
+        store_cached(key, serialize_extractions(extractions))
+        return extractions
+
+    def _process_extractions(self, extractions: List[lx.data.Extraction]) -> Dict[str, Any]:
+        """
+        Convert extractions to organized key-value pairs
+
+        Args:
+            extractions: LangExtract extractions
 
-            # Ensure category exists
-            if category not in key_values:
+        Returns:
+            Dictionary of organized key-value pairs by category
+        """
+        if not extractions:
+            return {category: {} for category in KEY_VALUE_CATEGORIES}
+
+        # Single pass: categories only appear once they get a pair
+        grouped = defaultdict(dict)
+        for extraction in extractions:
+            attributes = extraction.attributes
+            if not attributes:
+                continue
+            category = extraction.extraction_class
+            if category not in KNOWN_CATEGORIES:
                 category = "other_info"
+            grouped[category][attributes.get("field", "unknown_field")] = attributes.get("value", extraction.extraction_text)
 
-            # Extract field and value from attributes
-            if extraction.attributes:
-                field = extraction.attributes.get("field", "unknown_field")
-                value = extraction.attributes.get("value", extraction.extraction_text)
+        # Keep the usual category order
+        return {category: grouped[category] for category in KEY_VALUE_CATEGORIES if category in grouped}
 
-                # Store the key-value pair
-                key_values[category][field] = value
 
-        # Remove empty categories
-        key_values = {k: v for k, v in key_values.items() if v}
+def serialize_extractions(extractions: List[lx.data.Extraction]) -> List[Dict[str, Any]]:
+    """Convert extractions to JSON-ready dictionaries"""
+    return [
+        {
+            "class": e.extraction_class,
+            "text": e.extraction_text,
+            "attributes": e.attributes
+        }
+        for e in extractions
+    ]
+
 
-        return key_values
+def deserialize_extractions(items: List[Dict[str, Any]]) -> List[lx.data.Extraction]:
+    """Rebuild extractions from serialize_extractions output"""
+    return [
+        lx.data.Extraction(
+            extraction_class=item["class"],
+            extraction_text=item["text"],
+            attributes=item["attributes"]
+        )
+        for item in items
+    ]
 
 
-def read_pdf_text(pdf_path: Path) -> str:
+def read_pdf_pages(pdf_path: Path) -> List[str]:
     """
-    Read text from PDF file
+    Read the text of each page of a PDF file
 
     Args:
         pdf_path: Path to PDF file
 
     Returns:
-        Extracted text from PDF
+        Extracted text of each page (empty list if the PDF can't be read)
     """
     try:
-        import PyPDF2
+        if pdfium is not None:
+            # PDF workers read one at a time here; text extraction is fast next
+            # to the LLM calls they overlap
+            with PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(str(pdf_path))
+                try:
+                    pages = []
+                    for page in pdf:
+                        textpage = page.get_textpage()
+                        pages.append(textpage.get_text_range())
+                        textpage.close()
+                        page.close()
+                finally:
+                    pdf.close()
+            return pages
 
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
+        import PyPDF2
 
-        return text
+        # PyPDF2 seeks around the file a lot; read it through a memory map
+        # instead of many small buffered reads (pdfium maps the file itself)
+        with open(pdf_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pdf_reader = PyPDF2.PdfReader(mapped)
+            return [page.extract_text() or "" for page in pdf_reader.pages]
 
     except ImportError:
-        print("PyPDF2 not installed. Install with: pip install PyPDF2")
+        print("No PDF library installed. Install with: pip install pypdfium2 (or PyPDF2)")
         raise
     except Exception as e:
         print(f"Error reading PDF {pdf_path}: {str(e)}")
-        return ""
+        return []
+
+
+def dump_json(obj: Any, pretty: bool = False) -> bytes:
+    """
+    Serialize obj as UTF-8 JSON, with orjson when available
+
+    Args:
+        obj: JSON-compatible value
+        pretty: Indent by 2 spaces
+
+    Returns:
+        Encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(obj, indent=2 if pretty else None, ensure_ascii=False).encode('utf-8')
 
 
 def save_results(results: List[Dict], output_dir: Path):
@@ -232,15 +427,17 @@ def save_results(results: List[Dict], output_dir: Path):
     """
     # Save as formatted JSON for readability
     json_path = output_dir / "extraction_results.json"
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    json_path.write_bytes(dump_json(results, pretty=True))
     print(f"Saved results to {json_path}")
 
     # Save as JSONL for LangExtract compatibility
     jsonl_path = output_dir / "extraction_results.jsonl"
-    with open(jsonl_path, 'w', encoding='utf-8') as f:
-        for result in results:
-            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    # Built up in one buffer and written with a single call
+    buffer = bytearray()
+    for result in results:
+        buffer += dump_json(result)
+        buffer += b'\n'
+    jsonl_path.write_bytes(buffer)
     print(f"Saved JSONL to {jsonl_path}")
 
     # Save summary
@@ -266,6 +463,34 @@ def save_results(results: List[Dict], output_dir: Path):
     print(f"Saved summary to {summary_path}")
 
 
+def process_pdf(extractor: PDFExtractor, pdf_path: Path) -> Dict[str, Any]:
+    """
+    Read one PDF and extract its key-value pairs
+
+    Args:
+        extractor: Extractor to use
+        pdf_path: Path to PDF file
+
+    Returns:
+        Extraction result (an error result if no text could be read)
+    """
+    # Read PDF text
+    pages = read_pdf_pages(pdf_path)
+
+    if not pages:
+        print(f"Could not read text from {pdf_path.name}")
+        return {
+            "filename": pdf_path.name,
+            "timestamp": datetime.now().isoformat(),
+            "error": "Could not extract text from PDF",
+            "key_values": {},
+            "raw_extractions": []
+        }
+
+    # Extract key-value pairs
+    return extractor.extract_from_pages(pages, pdf_path.name)
+
+
 def main():
     """Main execution function"""
     print("\n" + "=" * 60)
@@ -311,15 +536,13 @@ def main():
     print("\nStarting extraction process...\n")
     results = []
 
-    for i, pdf_path in enumerate(pdf_files, 1):
-        print(f"[{i}/{len(pdf_files)}] Processing {pdf_path.name}...")
+    # PDFs are processed concurrently (the work is mostly waiting on the API);
+    # results come back, and are reported, in file order
+    with ThreadPoolExecutor(max_workers=PDF_WORKERS) as executor:
+        processed = executor.map(lambda pdf_path: process_pdf(extractor, pdf_path), pdf_files)
 
-        # Read PDF text
-        pdf_text = read_pdf_text(pdf_path)
-
-        if pdf_text:
-            # Extract key-value pairs
-            result = extractor.extract_from_text(pdf_text, pdf_path.name)
+        for i, (pdf_path, result) in enumerate(zip(pdf_files, processed), 1):
+            print(f"[{i}/{len(pdf_files)}] Processed {pdf_path.name}")
             results.append(result)
 
             # Print sample of extracted data
@@ -331,17 +554,10 @@ def main():
                         print(f"\t{category}:")
                         for field, value in sample_items:
                             print(f"\t\t- {field}: {value}")
-        else:
-            print(f"Could not read text from {pdf_path.name}")
-            results.append({
-                "filename": pdf_path.name,
-                "timestamp": datetime.now().isoformat(),
-                "error": "Could not extract text from PDF",
-                "key_values": {},
-                "raw_extractions": []
-            })
+            elif 'error' in result:
+                print(f"Error: {result['error']}")
 
-        print()
+            print()
 
     # Save results
     print("Saving results...")
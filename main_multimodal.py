@@ -3,23 +3,159 @@ PDF Key-Value Extraction using Multimodal LLM + LangExtract
 """
 
 import os
+import re
 import json
+import time
 import base64
+import asyncio
+import shutil
+import hashlib
+import tempfile
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import textwrap
 from datetime import datetime
-from io import BytesIO
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import langextract as lx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 from pdf2image import convert_from_path
 from PIL import Image
 
 # Load environment variables
 load_dotenv()
 
+# orjson (optional) serializes results several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# LangExtract settings; part of the cache key, so changing them re-runs extraction
+EXTRACT_SETTINGS = {
+    "fence_output": True,
+    "use_schema_constraints": False,
+    "extraction_passes": 2,
+    "max_workers": 5,
+    "max_char_buffer": 3000
+}
+
+VISION_PROMPT = "Read and transcribe all text from this form/document page. Include all field names and their filled values. Preserve the structure and formatting as much as possible."
+
+# Several pages go in one vision request; the reply marks where each page starts
+PAGE_MARKER_INSTRUCTION = (
+    "\n\nThe images are pages {pages} of the document, in order. Transcribe each one "
+    "separately, starting each page's transcription with a line '=== PAGE n ===' "
+    "where n is its page number."
+)
+PAGE_MARKER_RE = re.compile(r"^=== PAGE (\d+) ===[ \t]*$", re.MULTILINE)
+PAGES_PER_REQUEST = int(os.getenv("PAGES_PER_REQUEST", "4"))
+MAX_VISION_TOKENS = 16000  # gpt-4o output limit is 16,384
+
+# key_values categories, in output order; unknown extraction classes go to other_info
+KEY_VALUE_CATEGORIES = ("personal_info", "employment_info", "financial_info", "account_info", "other_info")
+KNOWN_CATEGORIES = frozenset(KEY_VALUE_CATEGORIES)
+
+# Pages are rendered at this DPI and cached under IMAGE_CACHE_DIR. 100 is enough
+# for printed forms; set RENDER_DPI=150 for handwritten ones. Larger pages are
+# shrunk to MAX_IMAGE_SIDE, past which the vision API downscales them anyway.
+RENDER_DPI = int(os.getenv("RENDER_DPI", "100"))
+MAX_IMAGE_SIDE = 2048
+IMAGE_CACHE_DIR = Path(".langextract_cache") / "images"
+
+# poppler encodes the pages as JPEG itself, and the files are sent as-is: several
+# times smaller than PNG, with no loss in transcription quality at this setting
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "88"))
+
+# PDFs processed at once, and vision requests in flight per PDF
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "4"))
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", "4"))
+
+# Page transcriptions and extraction results keyed by a hash of everything that
+# determines them (for pages: the model, prompt and encoded JPEG bytes), one
+# JSON file per key, so re-running over the same PDFs skips the LLM calls.
+# Delete the directory to force fresh results.
+CACHE_DIR = Path(".langextract_cache")
+CACHE_TTL = 7 * 24 * 3600  # seconds
+
+
+def cache_key(*parts) -> str:
+    """SHA-256 of the given strings or bytes"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def load_cached(key: str) -> Optional[Any]:
+    """Return the cached value for a key, or None if missing or expired"""
+    cache_path = CACHE_DIR / f"{key}.json"
+    try:
+        if time.time() - cache_path.stat().st_mtime < CACHE_TTL:
+            return json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def store_cached(key: str, value: Any):
+    """Write a value to the cache (errors are ignored)"""
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        (CACHE_DIR / f"{key}.json").write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+    except OSError:
+        pass
+
+
+def split_pages(text: str, page_nums: List[int]) -> Dict[int, str]:
+    """
+    Split a batched transcription on its '=== PAGE n ===' lines
+
+    Args:
+        text: Model reply
+        page_nums: Page numbers that were requested
+
+    Returns:
+        Text of each page found in the reply, by page number
+    """
+    parts = PAGE_MARKER_RE.split(text)
+    if len(parts) == 1:
+        # No markers: only usable when a single page was requested
+        return {page_nums[0]: text.strip()} if len(page_nums) == 1 else {}
+
+    pages = {}
+    for num, page_text in zip(parts[1::2], parts[2::2]):
+        if int(num) in page_nums and page_text.strip():
+            pages[int(num)] = page_text.strip()
+    return pages
+
+
+def serialize_extractions(extractions: List[lx.data.Extraction]) -> List[Dict[str, Any]]:
+    """Convert extractions to JSON-ready dictionaries"""
+    return [
+        {
+            "class": e.extraction_class,
+            "text": e.extraction_text,
+            "attributes": e.attributes
+        }
+        for e in extractions
+    ]
+
+
+def deserialize_extractions(items: List[Dict[str, Any]]) -> List[lx.data.Extraction]:
+    """Rebuild extractions from serialize_extractions output"""
+    return [
+        lx.data.Extraction(
+            extraction_class=item["class"],
+            extraction_text=item["text"],
+            attributes=item["attributes"]
+        )
+        for item in items
+    ]
+
 
 class MultimodalPDFExtractor:
     """Use GPT-4 Vision to read PDFs, then LangExtract for structured extraction"""
@@ -34,13 +170,13 @@ class MultimodalPDFExtractor:
         """
         self.vision_model = vision_model
         self.extraction_model = extraction_model
+        # Results of one run share its start time
+        self.run_timestamp = datetime.now().isoformat()
         self.api_key = os.getenv('OPENAI_API_KEY')
 
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY not found in .env file")
 
-        self.client = OpenAI(api_key=self.api_key)
-
         # LangExtract prompt and examples
         self.prompt = textwrap.dedent("""
             Extract key-value pairs from form documents.
@@ -52,7 +188,14 @@ class MultimodalPDFExtractor:
             extract complete information including all subfields.
         """)
 
-        self.examples = self._create_examples()
+        self.examples = tuple(self._create_examples())
+
+        # Everything but the text that determines an extraction, hashed once
+        # here instead of re-serializing the examples for every document
+        self._extract_key = cache_key(
+            self.prompt, repr(self.examples), self.extraction_model,
+            json.dumps(EXTRACT_SETTINGS, sort_keys=True)
+        )
 
     def _create_examples(self) -> List[lx.data.ExampleData]:
         """Create few-shot examples for LangExtract"""
@@ -122,13 +265,7 @@ class MultimodalPDFExtractor:
 
             # Step 2: Use vision model to read each page
             print(f"Reading {len(images)} pages with {self.vision_model}...")
-            page_texts = []
-
-            for i, image in enumerate(images):
-                print(f"Page {i + 1}/{len(images)}...")
-                text = self._read_image_with_vision(image, page_num=i + 1)
-                if text:
-                    page_texts.append(text)
+            page_texts = [text for text in asyncio.run(self._read_pages_with_vision(images)) if text]
 
             if not page_texts:
                 return self._error_result(filename, "Could not extract text from PDF images")
@@ -139,130 +276,213 @@ class MultimodalPDFExtractor:
 
             # Step 3: Use LangExtract for structured extraction
             print(f"Running structured extraction with LangExtract...")
-            result = lx.extract(
-                text_or_documents=full_text,
-                prompt_description=self.prompt,
-                examples=self.examples,
-                model_id=self.extraction_model,
-                api_key=self.api_key,
-                fence_output=True,
-                use_schema_constraints=False,
-                extraction_passes=2,
-                max_workers=5,
-                max_char_buffer=3000
-            )
+            extractions = self._extract_cached(full_text)
 
-            key_values = self._process_extractions(result)
+            key_values = self._process_extractions(extractions)
 
             return {
                 "filename": filename,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": self.run_timestamp,
                 "vision_model": self.vision_model,
                 "extraction_model": self.extraction_model,
                 "pages": len(images),
                 "text_length": len(full_text),
-                "extractions_count": len(result.extractions) if result.extractions else 0,
+                "extractions_count": len(extractions),
                 "key_values": key_values,
-                "raw_extractions": [
-                    {
-                        "class": e.extraction_class,
-                        "text": e.extraction_text,
-                        "attributes": e.attributes
-                    }
-                    for e in (result.extractions or [])
-                ]
+                "raw_extractions": serialize_extractions(extractions)
             }
 
         except Exception as e:
             print(f"Error processing {filename}: {str(e)}")
             return self._error_result(filename, str(e))
 
-    def _pdf_to_images(self, pdf_path: Path) -> List[Image.Image]:
-        """Convert PDF pages to images"""
+    def _extract_cached(self, text: str) -> List[lx.data.Extraction]:
+        """Run lx.extract on text, reusing the result of an identical earlier run"""
+        key = cache_key(self._extract_key, text)
+        cached = load_cached(key)
+        if cached is not None:
+            print("Using cached extraction")
+            return deserialize_extractions(cached)
+
+        result = lx.extract(
+            text_or_documents=text,
+            prompt_description=self.prompt,
+            examples=self.examples,
+            model_id=self.extraction_model,
+            api_key=self.api_key,
+            **EXTRACT_SETTINGS
+        )
+        extractions = list(result.extractions or [])
+        store_cached(key, serialize_extractions(extractions))
+        return extractions
+
+    def _pdf_to_images(self, pdf_path: Path) -> List[bytes]:
+        """
+        Convert PDF pages to JPEG images
+
+        Rendered pages are kept under IMAGE_CACHE_DIR, keyed by the PDF's
+        SHA-256, the DPI and the JPEG quality, so an unchanged PDF is only
+        rendered once.
+        """
         try:
-            # Convert with reasonable DPI for form reading
-            images = convert_from_path(pdf_path, dpi=150)
-            return images
+            digest = hashlib.sha256(pdf_path.read_bytes()).hexdigest()
+            cache_dir = IMAGE_CACHE_DIR / f"{digest}_{RENDER_DPI}_q{JPEG_QUALITY}"
+
+            if not cache_dir.is_dir():
+                # Render into a scratch folder, then rename it into place so a
+                # half-written render is never picked up
+                IMAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                scratch_dir = Path(tempfile.mkdtemp(dir=IMAGE_CACHE_DIR))
+                # poppler writes the JPEGs itself; page numbers are zero-padded, so names sort in page order
+                try:
+                    convert_from_path(
+                        pdf_path, dpi=RENDER_DPI, output_folder=scratch_dir,
+                        fmt="jpeg", jpegopt={"quality": JPEG_QUALITY},
+                        output_file="page", paths_only=True
+                    )
+                    for path in scratch_dir.glob("*.jpg"):
+                        self._shrink_image(path)
+                except Exception:
+                    shutil.rmtree(scratch_dir, ignore_errors=True)
+                    raise
+                try:
+                    scratch_dir.rename(cache_dir)
+                except OSError:
+                    # Another worker cached the same PDF first
+                    shutil.rmtree(scratch_dir, ignore_errors=True)
+
+            return [path.read_bytes() for path in sorted(cache_dir.glob("*.jpg"))]
         except Exception as e:
             print(f"Error converting PDF: {str(e)}")
             return []
 
-    def _read_image_with_vision(self, image: Image.Image, page_num: int) -> str:
+    @staticmethod
+    def _shrink_image(path: Path):
+        """Downscale an image in place so neither side exceeds MAX_IMAGE_SIDE"""
+        with Image.open(path) as image:
+            if max(image.size) <= MAX_IMAGE_SIDE:
+                return
+            image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.LANCZOS)
+            image.save(path, format="JPEG", quality=JPEG_QUALITY)
+
+    async def _read_pages_with_vision(self, images: List[bytes]) -> List[str]:
+        """
+        Read all pages, PAGES_PER_REQUEST per vision request, with at most
+        PAGE_WORKERS requests in flight
+
+        Args:
+            images: JPEG images, one per page
+
+        Returns:
+            Text of each page, in page order ("" for pages that failed)
+        """
+        semaphore = asyncio.Semaphore(PAGE_WORKERS)
+
+        # One client per PDF: its connection pool belongs to this event loop
+        async with AsyncOpenAI(api_key=self.api_key) as client:
+            async def read_batch(start_page: int, batch: List[bytes]) -> List[str]:
+                async with semaphore:
+                    print(f"Pages {start_page}-{start_page + len(batch) - 1}/{len(images)}...")
+                    return await self._read_images_with_vision_async(client, batch, start_page)
+
+            batches = await asyncio.gather(*(
+                read_batch(start + 1, images[start:start + PAGES_PER_REQUEST])
+                for start in range(0, len(images), PAGES_PER_REQUEST)
+            ))
+
+        return [text for batch in batches for text in batch]
+
+    async def _read_images_with_vision_async(
+        self,
+        client: AsyncOpenAI,
+        images: List[bytes],
+        start_page: int
+    ) -> List[str]:
         """
-        Use GPT-4 Vision to read text from image
+        Use GPT-4 Vision to read text from consecutive pages in one request
+
+        Pages with a cached transcription are not sent. If the reply can't be
+        split into pages, multi-page requests are retried one page at a time.
 
         Args:
-            image: PIL Image object
-            page_num: Page number for context
+            client: Async OpenAI client
+            images: JPEG images
+            start_page: Page number of the first image
 
         Returns:
-            Extracted text from the image
+            Extracted text of each image ("" for pages that failed)
         """
         try:
-            # Convert image to base64
-            buffered = BytesIO()
-            image.save(buffered, format="PNG")
-            image_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
+            # Identical page renders reuse their earlier transcription
+            keys = [cache_key(self.vision_model, VISION_PROMPT, image) for image in images]
+            texts = [load_cached(key) or "" for key in keys]
+            missing = [i for i, text in enumerate(texts) if not text]
+            if not missing:
+                return texts
+
+            page_nums = [start_page + i for i in missing]
+            content = [{
+                "type": "text",
+                "text": VISION_PROMPT + PAGE_MARKER_INSTRUCTION.format(
+                    pages=", ".join(map(str, page_nums))
+                )
+            }]
+            for i in missing:
+                image_base64 = base64.b64encode(images[i]).decode('utf-8')
+                content.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{image_base64}",
+                        "detail": "high"# Use high detail for form reading
+                    }
+                })
+
+            payload_kb = sum(len(images[i]) for i in missing) / 1024
+            print(f"Sending pages {', '.join(map(str, page_nums))} ({payload_kb:.0f} KB of images)")
 
             # Call GPT-4 Vision
-            response = self.client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=self.vision_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "Read and transcribe all text from this form/document page. Include all field names and their filled values. Preserve the structure and formatting as much as possible."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{image_base64}",
-                                    "detail": "high"# Use high detail for form reading
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=4000,
+                messages=[{"role": "user", "content": content}],
+                max_tokens=min(4000 * len(missing), MAX_VISION_TOKENS),
                 temperature=0.1  # Low temperature for accurate transcription
             )
 
-            return response.choices[0].message.content
+            page_texts = split_pages(response.choices[0].message.content or "", page_nums)
 
-        except Exception as e:
-            print(f"Vision API error: {str(e)}")
-            return ""
-
-    def _process_extractions(self, result) -> Dict[str, Any]:
-        """Convert LangExtract results to organized key-value pairs"""
-        key_values = {
-            "personal_info": {},
-            "employment_info": {},
-            "financial_info": {},
-            "account_info": {},
-            "other_info": {}
-        }
+            for i, page_num in zip(missing, page_nums):
+                text = page_texts.get(page_num, "")
+                if text:
+                    store_cached(keys[i], text)
+                    texts[i] = text
+                elif len(missing) > 1:
+                    print(f"Page {page_num} missing from batched reply, reading it alone...")
+                    texts[i] = (await self._read_images_with_vision_async(client, [images[i]], page_num))[0]
 
-        if not result.extractions:
-            return key_values
+            return texts
 
-        for extraction in result.extractions:
+        except Exception as e:
+            print(f"Vision API error (pages {start_page}-{start_page + len(images) - 1}): {str(e)}")
+            return [""] * len(images)
+
+    def _process_extractions(self, extractions: List[lx.data.Extraction]) -> Dict[str, Any]:
+        """Convert LangExtract extractions to organized key-value pairs"""
+        if not extractions:
+            return {category: {} for category in KEY_VALUE_CATEGORIES}
+
+        # Single pass: categories only appear once they get a pair
+        grouped = defaultdict(dict)
+        for extraction in extractions:
+            attributes = extraction.attributes
+            if not attributes:
+                continue
             category = extraction.extraction_class
-
-            if category not in key_values:
+            if category not in KNOWN_CATEGORIES:
                 category = "other_info"
+            grouped[category][attributes.get("field", "unknown_field")] = attributes.get("value", extraction.extraction_text)
 
-            if extraction.attributes:
-                field = extraction.attributes.get("field", "unknown_field")
-                value = extraction.attributes.get("value", extraction.extraction_text)
-                key_values[category][field] = value
-
-        # Remove empty categories
-        key_values = {k: v for k, v in key_values.items() if v}
-
-        return key_values
+        # Keep the usual category order
+        return {category: grouped[category] for category in KEY_VALUE_CATEGORIES if category in grouped}
 
     def _error_result(self, filename: str, error: str) -> Dict[str, Any]:
         """Create error result dictionary"""
@@ -275,19 +495,28 @@ class MultimodalPDFExtractor:
         }
 
 
+def dump_json(obj: Any, pretty: bool = False) -> bytes:
+    """Serialize obj as UTF-8 JSON (indented by 2 if pretty), with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    return json.dumps(obj, indent=2 if pretty else None, ensure_ascii=False).encode('utf-8')
+
+
 def save_results(results: List[Dict], output_dir: Path):
     """Save extraction results"""
     # JSON format
     json_path = output_dir / "extraction_results.json"
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    json_path.write_bytes(dump_json(results, pretty=True))
     print(f"Saved results to {json_path}")
 
     # JSONL format
     jsonl_path = output_dir / "extraction_results.jsonl"
-    with open(jsonl_path, 'w', encoding='utf-8') as f:
-        for result in results:
-            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    # Built up in one buffer and written with a single call
+    buffer = bytearray()
+    for result in results:
+        buffer += dump_json(result)
+        buffer += b'\n'
+    jsonl_path.write_bytes(buffer)
     print(f"Saved JSONL to {jsonl_path}")
 
     # Summary
@@ -414,25 +643,28 @@ def main():
     print("\nStarting extraction...\n")
     results = []
 
-    for i, pdf_path in enumerate(pdf_files, 1):
-        print(f"[{i}/{len(pdf_files)}] Processing {pdf_path.name}...")
-
-        result = extractor.extract_from_pdf(pdf_path)
-        results.append(result)
-
-        # Print sample results
-        if result['key_values']:
-            print(f"Extracted {result['extractions_count']} items from {result.get('pages', 'N/A')} pages")
-            for category, kvs in list(result['key_values'].items())[:2]:
-                if kvs:
-                    sample_items = list(kvs.items())[:3]
-                    print(f"{category}:")
-                    for field, value in sample_items:
-                        print(f"- {field}: {value}")
-        elif 'error' in result:
-            print(f"Error: {result['error']}")
-
-        print()
+    # PDFs are processed concurrently (the work is mostly waiting on the API);
+    # results come back, and are reported, in file order
+    with ThreadPoolExecutor(max_workers=PDF_WORKERS) as executor:
+        processed = executor.map(extractor.extract_from_pdf, pdf_files)
+
+        for i, (pdf_path, result) in enumerate(zip(pdf_files, processed), 1):
+            print(f"[{i}/{len(pdf_files)}] Processed {pdf_path.name}")
+            results.append(result)
+
+            # Print sample results
+            if result['key_values']:
+                print(f"Extracted {result['extractions_count']} items from {result.get('pages', 'N/A')} pages")
+                for category, kvs in list(result['key_values'].items())[:2]:
+                    if kvs:
+                        sample_items = list(kvs.items())[:3]
+                        print(f"{category}:")
+                        for field, value in sample_items:
+                            print(f"- {field}: {value}")
+            elif 'error' in result:
+                print(f"Error: {result['error']}")
+
+            print()
 
     # Save results
     print("Saving results...")
@@ -4,9 +4,12 @@ Ready to drop into your Azure Databricks project
 """
 
 import json
+import logging
 import time
 from typing import Dict, List, Optional
 
+logger = logging.getLogger(__name__)
+
 
 # ============================================================================
 # PART 1: ENHANCED CLASSIFICATION FUNCTIONS
@@ -79,7 +82,7 @@ DOCUMENT:
         return classification_dict
         
     except Exception as e:
-        print(f"Error in classification: {e}")
+        logger.exception("Error in classification")
         return {
             "label": "Other",
             "score": 0.0,
@@ -211,7 +214,7 @@ DOCUMENT CONTENT:
         return extraction_dict
         
     except Exception as e:
-        print(f"Error in extraction: {e}")
+        logger.exception("Error in extraction")
         return {
             "extracted_data": {key: None for key in keys_to_extract},
             "confidence_scores": {key: 0.0 for key in keys_to_extract},
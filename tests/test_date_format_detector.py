@@ -0,0 +1,61 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from date_format_detector import normalize_date, normalize_dates_batch
+
+
+def _normalize_each(date_strings, known_formats, desired_format, locale='US'):
+    """Scalar reference: normalize_date per string, None where it raises."""
+    results = []
+    for date_string in date_strings:
+        try:
+            results.append(normalize_date(date_string, known_formats, desired_format, locale))
+        except ValueError:
+            results.append(None)
+    return results
+
+
+class NormalizeDatesBatchTest(unittest.TestCase):
+    def assertMatchesScalar(self, date_strings, known_formats, desired_format='%Y-%m-%d', locale='US'):
+        # normalize_date takes the first fitting format in set iteration order,
+        # so compare against the same set, after the batch added its detections
+        known_formats = set(known_formats)
+        actual = normalize_dates_batch(date_strings, known_formats, desired_format, locale)
+        expected = _normalize_each(date_strings, known_formats, desired_format, locale)
+        self.assertEqual(actual, expected)
+
+    def test_detected_formats_match_scalar_detection(self):
+        date_strings = ['4/3/2014', '28/06/2004', '5/7/1999', '13 October 2024']
+        batch_formats, scalar_formats = {'%m/%d/%Y'}, {'%m/%d/%Y'}
+        normalize_dates_batch(date_strings, batch_formats, '%Y-%m-%d', 'UK')
+        _normalize_each(date_strings, scalar_formats, '%Y-%m-%d', 'UK')
+        self.assertEqual(batch_formats, scalar_formats)
+
+    def test_ambiguous_day_month_formats(self):
+        self.assertMatchesScalar(
+            ['13/02/2023', '01/02/2023', '02/13/2023', '12/11/2023', '1/2/2023'],
+            {'%m/%d/%Y', '%d/%m/%Y'}
+        )
+
+    def test_ambiguous_formats_with_other_buckets(self):
+        self.assertMatchesScalar(
+            ['27/06/2023', '06/07/2023', '2023-06-27', '2023-06-27 15:37:38+00:00', '13 October 2024'],
+            {'%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%d', '%Y-%m-%d %H:%M:%S%z'},
+            '%d/%m/%Y %H:%M'
+        )
+
+    def test_single_known_format(self):
+        self.assertMatchesScalar(
+            ['27/06/2023', '15/08/2023', '31/02/2023', 'not a date'],
+            {'%d/%m/%Y'}
+        )
+
+    def test_no_known_formats(self):
+        self.assertMatchesScalar(['06/27/2023', '07/04/2023', '2023-06-27'], set())
+
+
+if __name__ == '__main__':
+    unittest.main()